@@ -0,0 +1,88 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+from recipes.invalidation import stamps
+from recipes.models import user_version
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы для list и retrieve.
+    ETag и Last-Modified считаются по счётчикам Version до сериализации
+    (из кэша процесса, см. recipes.invalidation),
+    на If-None-Match/If-Modified-Since сразу отдаётся 304.
+    При per_user_version ответ зависит от токена (флаги is_favorited
+    и т.п.), поэтому в ETag входит версия данных пользователя.
+    При micro_cache ответы анонимам помечаются для микрокэша nginx."""
+
+    version_names = ()
+    per_user_version = False
+    micro_cache = False
+
+    def get_version_names(self, request):
+        names = list(self.version_names)
+        if self.per_user_version and request.user.is_authenticated:
+            names.append(user_version(request.user.id))
+        return names
+
+    def get_extra_stamps(self):
+        """Дополнительные отметки (строка, дата изменения).
+        None - объекта нет, условный ответ не нужен."""
+        return []
+
+    def get_validators(self, request):
+        extra = self.get_extra_stamps()
+        if extra is None:
+            return None, None
+        names = self.get_version_names(request)
+        current = stamps(names)
+        parts = [request.get_full_path(), str(request.user.id)]
+        dates = []
+        for name in names:
+            stamp = current.get(name)
+            parts.append(f'{name}={stamp.version if stamp else 0}')
+            if stamp:
+                dates.append(stamp.updated_at)
+        for part, date in extra:
+            parts.append(part)
+            dates.append(date)
+        etag = quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest())
+        return etag, max(dates, default=None)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        timestamp = (int(last_modified.timestamp())
+                     if last_modified else None)
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            return response
+        response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+        if self.per_user_version:
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Authorization',))
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        if (self.micro_cache and settings.MICRO_CACHE_SECONDS
+                and response.status_code == 200
+                and not request.user.is_authenticated):
+            # Браузер по-прежнему проверяет ETag, а nginx отдаёт
+            # ответ анонимам из proxy_cache MICRO_CACHE_SECONDS секунд.
+            response['X-Accel-Expires'] = settings.MICRO_CACHE_SECONDS
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request,
+                                         *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request,
+                                         *args, **kwargs)
@@ -0,0 +1,62 @@
+"""Отдача сгенерированных файлов через nginx.
+
+При ACCEL_REDIRECT_ENABLED файл пишется в DOWNLOADS_DIR, а ответ
+содержит только заголовок X-Accel-Redirect: файл медленному клиенту
+отдаёт nginx, воркер gunicorn сразу освобождается. Имя файла - хэш
+содержимого, поэтому одинаковые списки не пишутся повторно. Файлы
+старше DOWNLOADS_MAX_AGE секунд удаляются при записи новых."""
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+
+def attachment(content, filename, content_type):
+    """Ответ с файлом content (bytes) для скачивания."""
+    if not settings.ACCEL_REDIRECT_ENABLED:
+        response = HttpResponse(content, content_type=content_type)
+    else:
+        name = hashlib.sha256(content).hexdigest() + os.path.splitext(
+            filename)[1]
+        _write(name, content)
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.ACCEL_REDIRECT_PREFIX + name
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _write(name, content):
+    directory = settings.DOWNLOADS_DIR
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        # Продлевает жизнь файла, который снова понадобился.
+        os.utime(path)
+        return
+    os.makedirs(directory, exist_ok=True)
+    _remove_expired(directory)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as tmp:
+        tmp.write(content)
+    os.chmod(tmp_path, 0o644)
+    # Параллельный запрос мог записать тот же файл: содержимое одно.
+    os.replace(tmp_path, path)
+
+
+def _remove_expired(directory):
+    deadline = time.time() - settings.DOWNLOADS_MAX_AGE
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.exception('Не удалось удалить файл %s', entry.path)
@@ -0,0 +1,161 @@
+"""SSE-поток изменений избранного, корзины и подписок: /api/events/.
+
+Django 3.2 не умеет асинхронно отдавать потоковый ответ, поэтому
+поток обслуживается отдельным ASGI-приложением (см. foodgram/asgi.py)
+под uvicorn, остальные запросы идут в Django.
+
+Авторизация - токеном в заголовке Authorization или в параметре
+?token= (EventSource не умеет задавать заголовки). id события -
+номер изменения в журнале синхронизации: после переподключения
+по Last-Event-ID (или ?last_event_id=) досылается пропущенное.
+Если пропущено больше SSE_BUFFER_SIZE событий, приходит событие
+reset и поток закрывается: клиент догоняет данные через /api/sync/."""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from recipes import sync
+from recipes.push import hub
+from rest_framework.authtoken.models import Token
+
+HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    # Буферизация nginx задержала бы события.
+    (b'x-accel-buffering', b'no'),
+]
+
+
+@sync_to_async
+def _authenticate(key):
+    close_old_connections()
+    try:
+        return Token.objects.filter(
+            key=key, user__is_active=True).values_list(
+                'user_id', flat=True).first()
+    finally:
+        close_old_connections()
+
+
+@sync_to_async
+def _events_after(user_id, last_seq):
+    close_old_connections()
+    try:
+        return sync.push_events_after(user_id, last_seq,
+                                      settings.SSE_BUFFER_SIZE)
+    finally:
+        close_old_connections()
+
+
+@sync_to_async
+def _latest_seq(user_id):
+    close_old_connections()
+    try:
+        return sync.latest_seq(user_id)
+    finally:
+        close_old_connections()
+
+
+def _format(event):
+    data = json.dumps({key: event[key] for key in ('entity', 'id', 'action')})
+    return f'id: {event["seq"]}\nevent: change\ndata: {data}\n\n'.encode()
+
+
+RESET = b'event: reset\ndata: {}\n\n'
+HEARTBEAT = b': ping\n\n'
+
+
+def _params(scope):
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+               for name, value in scope['headers']}
+    query = {name: values[-1] for name, values in parse_qs(
+        scope.get('query_string', b'').decode('latin-1')).items()}
+    token = query.get('token')
+    authorization = headers.get('authorization', '').split()
+    if len(authorization) == 2 and authorization[0].lower() == 'token':
+        token = authorization[1]
+    last_event_id = headers.get('last-event-id', query.get('last_event_id'))
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    return token, last_event_id
+
+
+async def _respond(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body',
+                'body': json.dumps(body).encode()})
+
+
+async def _stream(send, listener, last_seq):
+    """Отправляет события, пока клиент подключён.
+    Возвращается после события reset."""
+    body = f'retry: {settings.SSE_RETRY_MS}\n\n'.encode()
+    await send({'type': 'http.response.body', 'body': body,
+                'more_body': True})
+    catch_up = last_seq is not None
+    if last_seq is None:
+        last_seq = await _latest_seq(listener.user_id)
+    while True:
+        if catch_up:
+            # События, пришедшие во время чтения журнала, остаются
+            # в очереди и могут повториться: это безопасно.
+            events = await _events_after(listener.user_id, last_seq)
+            if events is None:
+                await send({'type': 'http.response.body', 'body': RESET})
+                return
+        else:
+            try:
+                await asyncio.wait_for(listener.ready.wait(),
+                                       settings.SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                await send({'type': 'http.response.body',
+                            'body': HEARTBEAT, 'more_body': True})
+                continue
+            events, catch_up = listener.take()
+            if catch_up:
+                continue
+        if events:
+            await send({'type': 'http.response.body',
+                        'body': b''.join(map(_format, events)),
+                        'more_body': True})
+            last_seq = max(last_seq, *(event['seq'] for event in events))
+        catch_up = False
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def application(scope, receive, send):
+    if scope['method'] != 'GET':
+        await _respond(send, 405, {'detail': 'Метод не разрешён.'})
+        return
+    token, last_event_id = _params(scope)
+    user_id = await _authenticate(token) if token else None
+    if user_id is None:
+        await _respond(send, 401,
+                       {'detail': 'Учетные данные не были предоставлены.'})
+        return
+    listener = hub.subscribe(user_id)
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': HEADERS})
+        tasks = {asyncio.ensure_future(_wait_disconnect(receive)),
+                 asyncio.ensure_future(_stream(send, listener,
+                                               last_event_id))}
+        done, pending = await asyncio.wait(
+            tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+    finally:
+        hub.unsubscribe(listener)
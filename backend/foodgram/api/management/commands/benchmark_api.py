@@ -0,0 +1,180 @@
+import json
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from recipes.models import Recipe, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+METRIC_KEYS = ('p50_ms', 'p95_ms', 'queries_avg', 'rps')
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1,
+                round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    """Прогоняет основные эндпоинты API внутри процесса через
+    тестовый клиент DRF и сохраняет результаты в JSON."""
+
+    help = 'Бенчмарк основных эндпоинтов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Количество замеров на эндпоинт')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', nargs='*', default=None,
+                            help='Имена сценариев для запуска')
+        parser.add_argument('--output', default=None,
+                            help='Файл для результатов в формате JSON')
+        parser.add_argument('--compare', default=None,
+                            help='JSON предыдущего запуска для сравнения')
+        parser.add_argument('--middleware', choices=('lean', 'full'),
+                            default='lean',
+                            help='full - прогонять запросы к API через '
+                                 'сессии, CSRF и сообщения')
+        parser.add_argument('--token-auth', action='store_true',
+                            help='Заголовок Authorization с токеном '
+                                 'вместо force_authenticate')
+        parser.add_argument('--browser-session', action='store_true',
+                            help='Дополнительно войти в сессию, как '
+                                 'браузер администратора')
+
+    def handle(self, *args, **options):
+        user = (User.objects.annotate(cart=Count('shopping_cart'),
+                                      subs=Count('follower', distinct=True))
+                .filter(cart__gt=0).order_by('-subs').first())
+        recipe = Recipe.objects.first()
+        if user is None or recipe is None:
+            raise CommandError('Нет данных: выполните seed_benchmark.')
+        tag = Tag.objects.first()
+        word = recipe.name.split()[0]
+        scenarios = self.get_scenarios(user, recipe, tag, word)
+        if options['only']:
+            scenarios = [scenario for scenario in scenarios
+                         if scenario[0] in options['only']]
+        results = {}
+        lean = options['middleware'] == 'lean'
+        with override_settings(API_LEAN_MIDDLEWARE=lean,
+                               THROTTLE_ENABLED=False):
+            for name, path, params, auth in scenarios:
+                client = self.get_client(user, auth, options)
+                results[name] = self.measure(client, path, params,
+                                             options['requests'],
+                                             options['warmup'])
+                self.stdout.write(self.format_row(name, results[name]))
+        report = {
+            'commit': self.get_commit(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'requests': options['requests'],
+            'middleware': options['middleware'],
+            'token_auth': options['token_auth'],
+            'browser_session': options['browser_session'],
+            'results': results,
+        }
+        output = options['output'] or f'benchmark-{report["commit"]}.json'
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты: {output}'))
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def get_scenarios(self, user, recipe, tag, word):
+        """Сценарии: имя, путь, параметры, нужна ли авторизация."""
+        return [
+            ('recipes-list', '/api/recipes/', {}, False),
+            ('recipes-list-auth', '/api/recipes/', {}, True),
+            ('recipes-list-filtered', '/api/recipes/',
+             {'tags': tag.slug if tag else '', 'is_favorited': 1}, True),
+            ('recipes-search', '/api/recipes/', {'search': word}, False),
+            ('recipes-detail', f'/api/recipes/{recipe.id}/', {}, True),
+            ('tags-list', '/api/tags/', {}, False),
+            ('ingredients-list', '/api/ingredients/', {'name': 'а'}, False),
+            ('users-list', '/api/users/', {}, True),
+            ('users-subscriptions', '/api/users/subscriptions/',
+             {'recipes_limit': 3}, True),
+            ('recipes-download-shopping-cart',
+             '/api/recipes/download_shopping_cart/', {}, True),
+        ]
+
+    def get_client(self, user, auth, options):
+        client = APIClient(SERVER_NAME='localhost')
+        if options['browser_session']:
+            client.force_login(user)
+        if not auth:
+            return client
+        if options['token_auth']:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        else:
+            client.force_authenticate(user)
+        return client
+
+    def measure(self, client, path, params, requests, warmup):
+        for _ in range(warmup):
+            client.get(path, params)
+        timings = []
+        queries = []
+        status_codes = set()
+        started = time.perf_counter()
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(path, params)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+            status_codes.add(response.status_code)
+        elapsed = time.perf_counter() - started
+        return {
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'queries_avg': round(statistics.mean(queries), 2),
+            'queries_max': max(queries),
+            'rps': round(requests / elapsed, 2),
+            'status_codes': sorted(status_codes),
+        }
+
+    def format_row(self, name, result):
+        return (f'{name:<34} p50 {result["p50_ms"]:>9.2f} мс  '
+                f'p95 {result["p95_ms"]:>9.2f} мс  '
+                f'SQL {result["queries_avg"]:>7.1f}  '
+                f'{result["rps"]:>8.1f} rps  {result["status_codes"]}')
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)
+        self.stdout.write(f'Сравнение с {previous.get("commit")}:')
+        for name, result in results.items():
+            before = previous['results'].get(name)
+            if before is None:
+                continue
+            changes = '  '.join(
+                f'{key} {before[key]} -> {result[key]}'
+                for key in METRIC_KEYS)
+            self.stdout.write(f'{name:<34} {changes}')
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+                check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return 'unknown'
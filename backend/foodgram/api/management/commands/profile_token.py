@@ -0,0 +1,14 @@
+from api.profiling import make_token
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Выдаёт подписанный токен для профилирования запросов."""
+
+    help = 'Токен для заголовка X-Profile-Token'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write(
+            f'Действителен {settings.PROFILING_TOKEN_MAX_AGE} с.')
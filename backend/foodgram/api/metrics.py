@@ -0,0 +1,317 @@
+"""Сбор метрик запросов к API и экспорт в формате Prometheus.
+
+Метрики копятся в памяти процесса. Если задан METRICS_DIR, каждый
+воркер раз в METRICS_FLUSH_SECONDS сохраняет их в свой файл, а /metrics
+суммирует файлы всех воркеров: любой воркер отдаёт общие значения.
+Без METRICS_DIR воркер отдаёт только свои значения с меткой pid."""
+
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseForbidden
+from recipes import outbox
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MAX_CAPTURED_QUERIES = 200
+OUTBOX_CACHE_KEY = 'metrics:outbox'
+
+current_request = ContextVar('current_request', default=None)
+
+
+class Histogram:
+    """Гистограмма с накопительными бакетами, как в Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, total, count):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield str(bound), cumulative
+        yield '+Inf', self.count
+
+
+HISTOGRAMS = {
+    'foodgram_http_request_duration_seconds': (
+        'Время обработки запроса.', LATENCY_BUCKETS),
+    'foodgram_db_queries_per_request': (
+        'Количество SQL-запросов за запрос.', QUERY_COUNT_BUCKETS),
+    'foodgram_db_duration_seconds': (
+        'Время выполнения SQL-запросов за запрос.', LATENCY_BUCKETS),
+    'foodgram_serializer_duration_seconds': (
+        'Время сериализации ответа.', LATENCY_BUCKETS),
+    'foodgram_http_response_size_bytes': (
+        'Размер тела ответа.', SIZE_BUCKETS),
+}
+COUNTERS = {
+    'foodgram_http_requests_total': 'Количество запросов.',
+    'foodgram_slow_requests_total': 'Количество медленных запросов.',
+}
+OUTBOX_GAUGES = {
+    'pending': ('foodgram_outbox_pending_events',
+                'Необработанные события outbox.'),
+    'lag_seconds': ('foodgram_outbox_lag_seconds',
+                    'Возраст самого старого необработанного события.'),
+    'failed': ('foodgram_outbox_failed_events',
+               'События outbox, исчерпавшие попытки.'),
+}
+
+
+class Registry:
+    """Потокобезопасное хранилище метрик по маршрутам."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+        self._path = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name in HISTOGRAMS}
+            self._counters = {name: {} for name in COUNTERS}
+
+    def observe(self, name, labels, value):
+        self._start_flusher()
+        with self._lock:
+            series = self._histograms[name]
+            if labels not in series:
+                series[labels] = Histogram(HISTOGRAMS[name][1])
+            series[labels].observe(value)
+
+    def inc(self, name, labels, value=1):
+        self._start_flusher()
+        with self._lock:
+            series = self._counters[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def snapshot(self):
+        """Метрики процесса в виде, пригодном для JSON."""
+        with self._lock:
+            return {
+                'counters': {
+                    name: [[labels, value]
+                           for labels, value in series.items()]
+                    for name, series in self._counters.items()},
+                'histograms': {
+                    name: [[labels, histogram.counts, histogram.sum,
+                            histogram.count]
+                           for labels, histogram in series.items()]
+                    for name, series in self._histograms.items()},
+            }
+
+    def _start_flusher(self):
+        """Запускает в процессе (после fork - заново) поток,
+        который сохраняет метрики в METRICS_DIR."""
+        pid = os.getpid()
+        if self._flusher_pid == pid or not settings.METRICS_DIR:
+            return
+        with self._lock:
+            if self._flusher_pid == pid:
+                return
+            self._flusher_pid = pid
+            # Время запуска в имени: новый воркер с тем же pid
+            # не затрёт файл завершившегося.
+            self._path = os.path.join(settings.METRICS_DIR,
+                                      f'{pid}-{time.time_ns()}.json')
+        threading.Thread(target=self._flush_forever, daemon=True,
+                         name='metrics-flush').start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_SECONDS)
+            self.flush()
+
+    def flush(self):
+        """Сохраняет метрики процесса в его файл в METRICS_DIR."""
+        if self._path is None or self._flusher_pid != os.getpid():
+            return
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(temp_path, self._path)
+
+    def _collect(self):
+        """Сумма метрик всех процессов из METRICS_DIR. Файлы
+        завершившихся воркеров учитываются, чтобы счётчики
+        не уменьшались при их перезапуске."""
+        self.flush()
+        merged = Registry()
+        try:
+            names = [name for name in os.listdir(settings.METRICS_DIR)
+                     if name.endswith('.json')]
+        except FileNotFoundError:
+            names = []
+        snapshots = []
+        for name in names:
+            try:
+                with open(os.path.join(settings.METRICS_DIR, name),
+                          encoding='utf-8') as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        if self._path is None:
+            snapshots.append(self.snapshot())
+        for snapshot in snapshots:
+            for name, rows in snapshot['counters'].items():
+                series = merged._counters.get(name)
+                if series is None:
+                    continue
+                for labels, value in rows:
+                    labels = tuple(map(tuple, labels))
+                    series[labels] = series.get(labels, 0) + value
+            for name, rows in snapshot['histograms'].items():
+                series = merged._histograms.get(name)
+                if series is None:
+                    continue
+                for labels, counts, total, count in rows:
+                    labels = tuple(map(tuple, labels))
+                    if labels not in series:
+                        series[labels] = Histogram(HISTOGRAMS[name][1])
+                    series[labels].merge(counts, total, count)
+        return merged
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus 0.0.4."""
+        if settings.METRICS_DIR:
+            return self._collect()._render({})
+        return self._render({'pid': str(os.getpid())})
+
+    def _render(self, extra):
+        lines = []
+        with self._lock:
+            for name, help_text in COUNTERS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(
+                        f'{name}{_labels(labels, **extra)} {value}')
+            for name, (help_text, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(
+                        self._histograms[name].items()):
+                    for bound, count in histogram.samples():
+                        bucket = _labels(labels, le=bound, **extra)
+                        lines.append(f'{name}_bucket{bucket} {count}')
+                    lines.append(f'{name}_sum{_labels(labels, **extra)} '
+                                 f'{histogram.sum}')
+                    lines.append(f'{name}_count{_labels(labels, **extra)} '
+                                 f'{histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    body = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"'))
+        for key, value in pairs)
+    return '{' + body + '}'
+
+
+registry = Registry()
+
+
+class RequestStats:
+    """Данные одного запроса: SQL-запросы, время БД и сериализации."""
+
+    def __init__(self, capture_sql=False):
+        self.capture_sql = capture_sql
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.captured = []
+        self._serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обёртка для connection.execute_wrapper."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += duration
+            if (self.capture_sql
+                    and len(self.captured) < MAX_CAPTURED_QUERIES):
+                self.captured.append(
+                    {'sql': sql, 'time_ms': round(duration * 1000, 3)})
+
+
+@contextmanager
+def serializer_timer():
+    """Учитывает время сериализации верхнего уровня,
+    вложенные сериализаторы повторно не считаются."""
+    stats = current_request.get()
+    if stats is None or stats._serializer_depth:
+        yield
+        return
+    stats._serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - start
+        stats._serializer_depth -= 1
+
+
+class SerializerTimingMixin:
+    """Замеряет время to_representation для метрик запроса."""
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+def render_outbox_gauges():
+    """Очередь outbox общая для всех процессов, поэтому считается
+    запросом к БД без метки pid. Результат кэшируется на
+    METRICS_OUTBOX_CACHE_SECONDS, чтобы частый опрос не нагружал БД."""
+    timeout = settings.METRICS_OUTBOX_CACHE_SECONDS
+    stats = (cache.get_or_set(OUTBOX_CACHE_KEY, outbox.lag, timeout)
+             if timeout else outbox.lag())
+    lines = []
+    for key, (name, help_text) in OUTBOX_GAUGES.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {stats[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Эндпоинт /metrics для Prometheus. Снаружи закрыт в nginx,
+    Prometheus опрашивает backend напрямую во внутренней сети.
+    С METRICS_TOKEN нужен заголовок Authorization: Bearer <токен>."""
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render() + render_outbox_gauges(),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,209 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import metrics, profiling, querycheck
+
+logger = logging.getLogger(__name__)
+
+
+def is_lean_api_request(request):
+    """Запрос к API с токеном или без cookie сессии.
+    API авторизует только по токену, поэтому сессия, CSRF,
+    сообщения и X-Frame-Options ему не нужны."""
+    lean = getattr(request, '_lean_api', None)
+    if lean is None:
+        lean = (settings.API_LEAN_MIDDLEWARE
+                and request.path_info.startswith(settings.API_PATH_PREFIX)
+                and (request.META.get('HTTP_AUTHORIZATION', '')
+                     .startswith('Token ')
+                     or settings.SESSION_COOKIE_NAME not in request.COOKIES))
+        request._lean_api = lean
+    return lean
+
+
+class BrowserOnlyMixin:
+    """Пропускает middleware для запросов is_lean_api_request.
+    Подклассы остаются наследниками стандартных классов,
+    поэтому проверки админки их находят."""
+
+    def __call__(self, request):
+        if is_lean_api_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class BrowserSessionMiddleware(BrowserOnlyMixin, SessionMiddleware):
+    pass
+
+
+class BrowserCsrfViewMiddleware(BrowserOnlyMixin, CsrfViewMiddleware):
+
+    def process_view(self, request, *args, **kwargs):
+        if is_lean_api_request(request):
+            return None
+        return super().process_view(request, *args, **kwargs)
+
+
+class BrowserAuthenticationMiddleware(BrowserOnlyMixin,
+                                      AuthenticationMiddleware):
+    pass
+
+
+class BrowserMessageMiddleware(BrowserOnlyMixin, MessageMiddleware):
+    pass
+
+
+class BrowserXFrameOptionsMiddleware(BrowserOnlyMixin,
+                                     XFrameOptionsMiddleware):
+    pass
+
+
+class MetricsMiddleware:
+    """Замеряет время запроса, количество и время SQL-запросов,
+    время сериализации и размер ответа для каждого маршрута
+    (например recipes-list, users-subscriptions)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        slow_ms = settings.METRICS_SLOW_REQUEST_MS
+        stats = metrics.RequestStats(capture_sql=bool(slow_ms))
+        token = metrics.current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        duration = time.perf_counter() - start
+        self._record(request, response, stats, duration, slow_ms)
+        return response
+
+    def _record(self, request, response, stats, duration, slow_ms):
+        match = request.resolver_match
+        route = (match.url_name or match.view_name) if match else 'unmatched'
+        labels = (('route', route), ('method', request.method))
+        size = 0 if response.streaming else len(response.content)
+        registry = metrics.registry
+        registry.inc('foodgram_http_requests_total',
+                     labels + (('status', str(response.status_code)),))
+        registry.observe('foodgram_http_request_duration_seconds',
+                         labels, duration)
+        registry.observe('foodgram_db_queries_per_request',
+                         labels, stats.queries)
+        registry.observe('foodgram_db_duration_seconds',
+                         labels, stats.db_time)
+        registry.observe('foodgram_serializer_duration_seconds',
+                         labels, stats.serializer_time)
+        registry.observe('foodgram_http_response_size_bytes',
+                         labels, size)
+        record = {
+            'route': route,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'db_queries': stats.queries,
+            'db_time_ms': round(stats.db_time * 1000, 3),
+            'serializer_time_ms': round(stats.serializer_time * 1000, 3),
+            'response_bytes': size,
+        }
+        if settings.METRICS_LOG_JSON:
+            logger.info(json.dumps(record, ensure_ascii=False))
+        if slow_ms and duration * 1000 >= slow_ms:
+            registry.inc('foodgram_slow_requests_total', labels)
+            record['queries'] = stats.captured
+            logger.warning('Медленный запрос: %s',
+                           json.dumps(record, ensure_ascii=False))
+
+
+class QueryInspectorMiddleware:
+    """Ищет повторяющиеся SQL-запросы (N+1) и проверяет бюджеты
+    запросов действий вьюсетов (query_budgets). Для разработки
+    и тестов: QUERY_INSPECTOR=warn или raise."""
+
+    def __init__(self, get_response):
+        if settings.QUERY_INSPECTOR not in ('warn', 'raise'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inspector = querycheck.QueryInspector()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(inspector))
+            response = self.get_response(request)
+        response['X-Query-Count'] = str(inspector.count)
+        where = f'{request.method} {request.get_full_path()}'
+        for group in inspector.repeated():
+            logger.warning('N+1 в %s: %s', where, querycheck.describe(group))
+        action, budget = querycheck.get_budget(request)
+        if budget is not None and inspector.count > budget:
+            message = (f'{where} ({action}): {inspector.count} SQL-запросов '
+                       f'при бюджете {budget}')
+            if settings.QUERY_INSPECTOR == 'raise':
+                raise querycheck.QueryBudgetExceeded('\n'.join(
+                    [message, *map(querycheck.describe,
+                                   inspector.repeated(2))]))
+            logger.warning(message)
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос, если передан заголовок X-Profile
+    (или параметр ?profile=) и запрос сделан администратором
+    либо содержит подписанный заголовок X-Profile-Token.
+    Значение sampling включает сэмплирующий профилировщик,
+    если установлен pyinstrument."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = (request.headers.get('X-Profile')
+                or request.GET.get('profile'))
+        if not mode or not self._is_allowed(request):
+            return self.get_response(request)
+        profiler = profiling.RequestProfiler(sampling=mode == 'sampling')
+        start = time.perf_counter()
+        response = profiler.run(self.get_response, request)
+        duration = time.perf_counter() - start
+        record = profiler.record(request, response, duration)
+        profiling.get_store().save(record)
+        response['X-Profile-Id'] = record['id']
+        response['X-Profile-Duration-Ms'] = str(record['duration_ms'])
+        response['X-Profile-Queries'] = str(record['db_queries'])
+        return response
+
+    def _is_allowed(self, request):
+        token = request.headers.get('X-Profile-Token')
+        if token:
+            return profiling.check_token(token)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        try:
+            user_auth = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return user_auth is not None and user_auth[0].is_staff
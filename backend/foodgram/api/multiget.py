@@ -0,0 +1,40 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+
+class MultiGetMixin:
+    """Получение нескольких объектов одним запросом: GET списка
+    с ?ids=3,1,2. Объекты выбираются одним запросом к БД с теми же
+    prefetch, что и обычный список, и отдаются в порядке ids.
+    Не найденные id перечисляются в поле missing."""
+
+    multi_get_param = 'ids'
+    multi_get_max = 100
+
+    def get_requested_ids(self):
+        value = self.request.query_params.get(self.multi_get_param)
+        if value is None:
+            return None
+        try:
+            ids = [int(item) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise ValidationError(
+                {self.multi_get_param: 'Ожидаются id через запятую.'})
+        if not ids or len(ids) > self.multi_get_max:
+            raise ValidationError(
+                {self.multi_get_param:
+                 f'Укажите от 1 до {self.multi_get_max} id.'})
+        return list(dict.fromkeys(ids))
+
+    def list(self, request, *args, **kwargs):
+        ids = self.get_requested_ids()
+        if ids is None:
+            return super().list(request, *args, **kwargs)
+        objects = {obj.pk: obj for obj in self.filter_queryset(
+            self.get_queryset()).filter(pk__in=ids)}
+        serializer = self.get_serializer(
+            [objects[pk] for pk in ids if pk in objects], many=True)
+        return Response({
+            'results': serializer.data,
+            'missing': [pk for pk in ids if pk not in objects],
+        })
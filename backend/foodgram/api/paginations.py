@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class PageLimitPagination(PageNumberPagination):
@@ -6,3 +6,11 @@ class PageLimitPagination(PageNumberPagination):
 
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class FeedCursorPagination(CursorPagination):
+    """Курсорная пагинация ленты подписок."""
+
+    page_size_query_param = 'limit'
+    page_size = 6
+    ordering = '-id'
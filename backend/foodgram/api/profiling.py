@@ -0,0 +1,175 @@
+"""Профилирование отдельных запросов по требованию.
+
+Профили хранятся в кольцевом буфере JSON-файлов на диске
+и просматриваются в админке по адресу /admin/profiles/."""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib import admin
+from django.core import signing
+from django.db import connections
+from django.http import Http404
+from django.shortcuts import render
+
+from .metrics import RequestStats
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:
+    SamplingProfiler = None
+
+SIGNING_SALT = 'api.profiling'
+TOP_FUNCTIONS = 40
+
+
+def make_token():
+    """Подписанный токен для заголовка X-Profile-Token."""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+
+def check_token(token):
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class ProfileStore:
+    """Кольцевой буфер профилей: хранит не больше max_records файлов,
+    самые старые удаляются при записи новых."""
+
+    def __init__(self, directory, max_records):
+        self.directory = directory
+        self.max_records = max_records
+
+    def _paths(self):
+        try:
+            names = sorted(name for name in os.listdir(self.directory)
+                           if name.endswith('.json'))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in names]
+
+    def save(self, record):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'{time.time_ns()}-{record["id"]}.json'
+        path = os.path.join(self.directory, name)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(record, file, ensure_ascii=False)
+        os.replace(temp_path, path)
+        paths = self._paths()
+        for old_path in paths[:max(len(paths) - self.max_records, 0)]:
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+    def list(self):
+        records = []
+        for path in reversed(self._paths()):
+            try:
+                with open(path, encoding='utf-8') as file:
+                    records.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return records
+
+    def get(self, profile_id):
+        for path in self._paths():
+            if path.endswith(f'-{profile_id}.json'):
+                with open(path, encoding='utf-8') as file:
+                    return json.load(file)
+        return None
+
+
+def get_store():
+    return ProfileStore(settings.PROFILING_DIR,
+                        settings.PROFILING_MAX_RECORDS)
+
+
+class RequestProfiler:
+    """Запускает обработку запроса под профилировщиком
+    и собирает выполненные SQL-запросы с их временем."""
+
+    def __init__(self, sampling=False):
+        self.sampling = sampling and SamplingProfiler is not None
+        self.stats = RequestStats(capture_sql=True)
+
+    def run(self, func, *args):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.stats))
+            if self.sampling:
+                self.profiler = SamplingProfiler()
+                self.profiler.start()
+                try:
+                    return func(*args)
+                finally:
+                    self.profiler.stop()
+            self.profiler = cProfile.Profile()
+            return self.profiler.runcall(func, *args)
+
+    def functions(self):
+        if self.sampling:
+            return [{'function': line} for line in self.profiler.output_text(
+                unicode=True, color=False).splitlines()[:TOP_FUNCTIONS * 2]]
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        functions = []
+        for function in stats.fcn_list[:TOP_FUNCTIONS]:
+            calls, primitive_calls, tottime, cumtime, _ = (
+                stats.stats[function])
+            filename, line, name = function
+            functions.append({
+                'function': f'{filename}:{line}({name})',
+                'calls': calls,
+                'tottime_ms': round(tottime * 1000, 3),
+                'cumtime_ms': round(cumtime * 1000, 3),
+            })
+        return functions
+
+    def record(self, request, response, duration):
+        return {
+            'id': uuid.uuid4().hex,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'user': str(request.user) if hasattr(request, 'user') else '',
+            'profiler': 'sampling' if self.sampling else 'cprofile',
+            'duration_ms': round(duration * 1000, 3),
+            'db_queries': self.stats.queries,
+            'db_time_ms': round(self.stats.db_time * 1000, 3),
+            'functions': self.functions(),
+            'queries': self.stats.captured,
+        }
+
+
+def profile_list(request):
+    return render(request, 'admin/api/profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Профили запросов',
+        'profiles': get_store().list(),
+    })
+
+
+def profile_detail(request, profile_id):
+    profile = get_store().get(profile_id)
+    if profile is None:
+        raise Http404('Профиль не найден')
+    return render(request, 'admin/api/profile_detail.html', {
+        **admin.site.each_context(request),
+        'title': f'{profile["method"]} {profile["path"]}',
+        'profile': profile,
+    })
@@ -0,0 +1,111 @@
+"""Поиск N+1 и бюджеты SQL-запросов для разработки и тестов.
+
+Каждый SQL-запрос приводится к отпечатку (литералы, параметры
+и списки IN заменяются на ?). Если один отпечаток повторяется
+QUERY_N_PLUS_ONE_THRESHOLD раз и больше, в лог пишется
+предупреждение с полем сериализатора и строкой кода проекта,
+из которых пришли запросы.
+
+Бюджет - наибольшее число запросов для действия вьюсета,
+задаётся атрибутом query_budgets. QUERY_INSPECTOR=warn пишет
+превышение в лог, raise бросает QueryBudgetExceeded, и тест
+на эндпоинт падает."""
+
+import os
+import re
+import sys
+from collections import Counter
+
+from django.conf import settings
+from rest_framework.serializers import Serializer
+
+PROJECT_DIR = str(settings.BASE_DIR)
+# Обёртки execute_wrapper и middleware - не источник запросов.
+IGNORED_FILES = tuple(
+    os.path.join(os.path.dirname(__file__), name)
+    for name in ('querycheck.py', 'metrics.py', 'middleware.py',
+                 'profiling.py'))
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+\b')
+LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql):
+    sql = STRING_RE.sub('?', sql.replace('%s', '?'))
+    sql = LIST_RE.sub('(?)', NUMBER_RE.sub('?', sql))
+    return ' '.join(sql.split())
+
+
+def _is_project_file(filename):
+    return (filename.startswith(PROJECT_DIR)
+            and 'site-packages' not in filename
+            and filename not in IGNORED_FILES)
+
+
+def query_origin():
+    """Цепочка полей сериализаторов и первая строка кода проекта,
+    из которых выполняется текущий запрос."""
+    fields = []
+    location = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == 'to_representation':
+            serializer = frame.f_locals.get('self')
+            field = frame.f_locals.get('field')
+            if isinstance(serializer, Serializer) and field is not None:
+                fields.append(
+                    f'{type(serializer).__name__}.{field.field_name}')
+        if location is None and _is_project_file(code.co_filename):
+            location = (f'{os.path.relpath(code.co_filename, PROJECT_DIR)}'
+                        f':{frame.f_lineno} ({code.co_name})')
+        frame = frame.f_back
+    return ' > '.join(reversed(fields)) or None, location
+
+
+class QueryInspector:
+    """Обёртка для connection.execute_wrapper: считает запросы
+    и группирует их по отпечаткам."""
+
+    def __init__(self):
+        self.count = 0
+        self.groups = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        group = self.groups.setdefault(
+            fingerprint(sql), {'count': 0, 'sql': sql, 'origins': Counter()})
+        group['count'] += 1
+        group['origins'][query_origin()] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold=None):
+        """Группы повторяющихся запросов, самые частые первыми."""
+        threshold = threshold or settings.QUERY_N_PLUS_ONE_THRESHOLD
+        return sorted((group for group in self.groups.values()
+                       if group['count'] >= threshold),
+                      key=lambda group: -group['count'])
+
+
+def describe(group):
+    origins = '; '.join(
+        f'{field or "-"} @ {location or "-"} x{count}'
+        for (field, location), count in group['origins'].most_common(3))
+    return f'{group["count"]} x {group["sql"][:200]} [{origins}]'
+
+
+def get_budget(request):
+    """Действие вьюсета и его бюджет из query_budgets."""
+    match = request.resolver_match
+    func = match.func if match else None
+    budgets = getattr(getattr(func, 'cls', None), 'query_budgets', None)
+    if not budgets:
+        return None, None
+    action = (getattr(func, 'actions', None) or {}).get(
+        request.method.lower())
+    return action, budgets.get(action)
@@ -4,11 +4,14 @@ from django.core.files.base import ContentFile
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
+from recipes import outbox
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, Tag, make_content_hash)
 from rest_framework import serializers, status
 from users.models import Subscription, User
 
+from .metrics import SerializerTimingMixin
+
 
 class Base64ImageField(serializers.ImageField):
     """Кодирует картинку в Base64."""
@@ -20,6 +23,46 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+class SparseFieldsetMixin:
+    """Оставляет только поля из context['fields'] и сворачивает
+    в id связи, не указанные в context['expand'].
+    Применяется только к сериализатору верхнего уровня."""
+
+    collapsed_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        requested = self.context.get('fields')
+        expand = self.context.get('expand')
+        if requested is not None:
+            fields = {name: field for name, field in fields.items()
+                      if name in requested}
+        if expand is not None:
+            for name, collapsed_field in self.collapsed_fields.items():
+                if name in fields and name not in expand:
+                    fields[name] = collapsed_field()
+        return fields
+
+
+def subscribed_author_ids(context):
+    """id авторов, на которых подписан пользователь запроса.
+    Загружаются один раз на запрос: контекст общий у вложенных
+    сериализаторов и у элементов списка."""
+    if 'subscribed_author_ids' not in context:
+        request = context.get('request')
+        user = request.user if request else None
+        context['subscribed_author_ids'] = (
+            set(Subscription.objects.filter(user=user).values_list(
+                'author_id', flat=True))
+            if user is not None and user.is_authenticated else set())
+    return context['subscribed_author_ids']
+
+
 class UserSignUpSerializer(UserCreateSerializer):
     """Связан с эндпоинтом api/users/ POST."""
 
@@ -29,7 +72,8 @@ class UserSignUpSerializer(UserCreateSerializer):
                   'last_name', 'password', 'id')
 
 
-class UserSerializer(UserSerializer):
+class UserSerializer(SerializerTimingMixin, SparseFieldsetMixin,
+                     UserSerializer):
     """Сериализует данные для эндпоинтов:
     api/users/ GET
     api/users/{id}/ GET
@@ -38,10 +82,7 @@ class UserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return (request.user.is_authenticated
-                and obj.following.filter(user=request.user,
-                                         author=obj).exists())
+        return obj.id in subscribed_author_ids(self.context)
 
     class Meta:
         model = User
@@ -49,7 +90,7 @@ class UserSerializer(UserSerializer):
                   'last_name', 'is_subscribed')
 
 
-class TagSerialiser(serializers.ModelSerializer):
+class TagSerialiser(SerializerTimingMixin, serializers.ModelSerializer):
     """Сериализатор для работы с моделью Tag для эндпоинтов:
     api/tags/ GET, api/tags/{id}/ GET."""
 
@@ -58,7 +99,7 @@ class TagSerialiser(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Сериализатор для работы с моделью Ingredient для эндпоинтов:
     api/ingredients/ GET, api/ingredients/{id}/ GET."""
 
@@ -92,9 +133,17 @@ class IngredientWriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SerializerTimingMixin, SparseFieldsetMixin,
+                           serializers.ModelSerializer):
     """Сериализатор для чтения рецептов."""
 
+    collapsed_fields = {
+        'author': lambda: serializers.PrimaryKeyRelatedField(
+            read_only=True),
+        'tags': lambda: serializers.PrimaryKeyRelatedField(
+            read_only=True, many=True),
+    }
+
     tags = TagSerialiser(read_only=True, many=True)
     author = UserSerializer(read_only=True)
     ingredients = IngredientReadSerializer(read_only=True, many=True,
@@ -104,11 +153,15 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     image = Base64ImageField(required=False)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'user_favorited'):
+            return obj.user_favorited
         user = self.context.get('request').user
         return (not user.is_anonymous
                 and obj.favorites.filter(user=user, recipe=obj).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'user_in_cart'):
+            return obj.user_in_cart
         user = self.context.get('request').user
         return (not user.is_anonymous
                 and obj.shopping_cart.filter(user=user, recipe=obj).exists())
@@ -159,6 +212,18 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             ingredients_list.append(ingredient)
         return value
 
+    def _check_duplicate(self, data):
+        """Ищет рецепт с тем же названием и описанием по хэшу."""
+        name = data.get('name', getattr(self.instance, 'name', ''))
+        text = data.get('text', getattr(self.instance, 'text', ''))
+        duplicates = Recipe.objects.filter(
+            content_hash=make_content_hash(name, text))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError(
+                'Такой рецепт уже есть, измените название или описание!')
+
     def _create_ingredient(self, ingredients, recipe):
         IngredientRecipe.objects.bulk_create([
             IngredientRecipe(
@@ -185,15 +250,10 @@ class RecipeCreateSerializer(RecipeWriteSerializer):
     def validate(self, data):
         tags = data['tags']
         ingredients = data['ingredients']
-        name = data['name']
-        text = data['text']
         if not (tags or ingredients):
             raise serializers.ValidationError(
                 'Выберите хотя бы одно значение!')
-        if Recipe.objects.filter(name=name,
-                                 text=text).exists():
-            raise serializers.ValidationError(
-                'Такой рецепт уже есть, измените название или описание!')
+        self._check_duplicate(data)
         return data
 
     @transaction.atomic
@@ -203,12 +263,19 @@ class RecipeCreateSerializer(RecipeWriteSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self._create_ingredient(ingredients, recipe)
+        outbox.publish('recipe.created',
+                       {'recipe_id': recipe.id, 'author_id': recipe.author_id},
+                       key=recipe.id)
         return recipe
 
 
 class RecipeUpdateSerializer(RecipeWriteSerializer):
     """Сериализатор для обновления рецепта."""
 
+    def validate(self, data):
+        self._check_duplicate(data)
+        return data
+
     @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
@@ -217,11 +284,11 @@ class RecipeUpdateSerializer(RecipeWriteSerializer):
         ingredients = validated_data.pop('ingredients')
         instance.ingredients.clear()
         self._create_ingredient(ingredients, instance)
-        instance.save()
-        return instance
+        return super().update(instance, validated_data)
 
 
-class SubscritionRecipeSerializer(serializers.ModelSerializer):
+class SubscritionRecipeSerializer(SerializerTimingMixin,
+                                  serializers.ModelSerializer):
     """Сериализатор для чтения подписок."""
 
     class Meta:
@@ -229,7 +296,8 @@ class SubscritionRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(SerializerTimingMixin,
+                             serializers.ModelSerializer):
     """Сериализатор модели Subscription, методы POST и DELETE."""
 
     id = serializers.ReadOnlyField(source='author.id')
@@ -257,7 +325,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
+        return obj.author.recipes_count
 
     def validate(self, data):
         user = self.context.get('request').user
@@ -278,7 +346,8 @@ class SubscriptionSerializer(serializers.ModelSerializer):
                   'recipes', 'is_subscribed', 'recipes_count')
 
 
-class SubscriptionsSerializer(serializers.ModelSerializer):
+class SubscriptionsSerializer(SerializerTimingMixin, SparseFieldsetMixin,
+                              serializers.ModelSerializer):
     """Список авторов на которых подписан пользователь."""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -286,12 +355,10 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
     recipes_count = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return Subscription.objects.filter(user=user,
-                                           author=obj).exists()
+        return obj.id in subscribed_author_ids(self.context)
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
         request = self.context.get('request')
@@ -309,15 +376,20 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class ShoppingCartSerializer(SerializerTimingMixin,
+                             serializers.ModelSerializer):
     """Сериализатор модели ShoppingCart."""
 
     def to_representation(self, instance):
         request = self.context.get('request')
-        return SubscritionRecipeSerializer(instance.recipe,
+        data = SubscritionRecipeSerializer(instance.recipe,
                                            context={'request': request}).data
+        data['servings'] = float(instance.servings)
+        return data
 
     def validate(self, data):
+        if self.instance is not None:
+            return data
         user = self.context.get('request').user
         recipe = self.context.get('recipe')
         if user.shopping_cart.filter(recipe=recipe).exists():
@@ -328,11 +400,11 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ShoppingCart
-        fields = ('user', 'recipe')
+        fields = ('user', 'recipe', 'servings')
         read_only_fields = ('user', 'recipe')
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Сериализатор модели Favorite."""
 
     def to_representation(self, instance):
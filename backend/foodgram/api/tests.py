@@ -0,0 +1,67 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import User
+
+from .querycheck import QueryBudgetExceeded
+from .views import RecipeViewSet
+
+
+@override_settings(QUERY_INSPECTOR='raise', THROTTLE_ENABLED=False)
+class QueryBudgetTest(TestCase):
+    """Действия с query_budgets укладываются в бюджет на засеянных
+    данных: при превышении QueryBudgetExceeded роняет тест."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_benchmark', users=20, recipes=60, favorites=5,
+                     cart=5, subscriptions=5, stdout=StringIO())
+        cls.user = User.objects.annotate(
+            subscriptions=Count('follower')).order_by(
+                '-subscriptions').first()
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def test_budgeted_actions(self):
+        recipe = Recipe.objects.order_by('id').first()
+        for url in ('/api/recipes/?limit=20',
+                    f'/api/recipes/{recipe.id}/',
+                    '/api/recipes/feed/',
+                    '/api/recipes/shopping_plan/',
+                    f'/api/recipes/shopping_plan/?recipes={recipe.id}:2',
+                    '/api/recipes/download_shopping_cart/',
+                    '/api/users/?limit=20',
+                    f'/api/users/{self.user.id}/',
+                    '/api/users/me/',
+                    '/api/users/subscriptions/?recipes_limit=2',
+                    '/api/ingredients/?name=а'):
+            with self.subTest(url=url):
+                response = self.get(url)
+                self.assertIn('X-Query-Count', response)
+
+    def test_n_plus_one_is_flagged(self):
+        # Список без select_related и аннотаций флагов пользователя.
+        with mock.patch.object(RecipeViewSet, 'get_queryset',
+                               lambda view: Recipe.objects.all()):
+            with self.assertRaises(QueryBudgetExceeded) as raised:
+                self.client.get('/api/recipes/?limit=20')
+            self.assertIn('RecipeReadSerializer.is_favorited',
+                          str(raised.exception))
+            with override_settings(QUERY_INSPECTOR='warn'), \
+                    self.assertLogs('api.middleware', 'WARNING') as logs:
+                APIClient().get('/api/recipes/?limit=20')
+        self.assertTrue(any('N+1' in line for line in logs.output))
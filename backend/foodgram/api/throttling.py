@@ -0,0 +1,86 @@
+import math
+import time
+from zlib import crc32
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'120/min' -> (120, 60)."""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class ActionRateThrottle(BaseThrottle):
+    """Ограничение частоты запросов по действиям вьюсета.
+    Действию назначается область в throttle_scopes вьюсета,
+    лимит области берётся из DEFAULT_THROTTLE_RATES.
+
+    Ведро на num запросов для пользователя (или IP анонима)
+    пополняется целиком раз в период. Проверка - один cache.incr
+    в общем кэше THROTTLE_CACHE, без списка отметок времени,
+    как у SimpleRateThrottle. Начало периода сдвинуто на величину,
+    зависящую от клиента, чтобы вёдра не пополнялись одновременно."""
+
+    def allow_request(self, request, view):
+        if not settings.THROTTLE_ENABLED:
+            return True
+        scope = getattr(view, 'throttle_scopes', {}).get(
+            getattr(view, 'action', None))
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+        num, period = parse_rate(rate)
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        offset = crc32(ident.encode()) % period
+        now = time.time()
+        window = int((now + offset) // period)
+        key = f'throttle:{scope}:{ident}:{window}'
+        count = self._incr(key, period)
+        self.limit = num
+        self.remaining = max(num - count, 0)
+        self.reset = (window + 1) * period - offset - now
+        state = getattr(request, 'rate_limit', None)
+        if state is None or self.remaining < state[1]:
+            request.rate_limit = (num, self.remaining, self.reset)
+        return count <= num
+
+    @staticmethod
+    def _incr(key, period):
+        cache = caches[settings.THROTTLE_CACHE]
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Первый запрос в периоде. Если ключ успел создать
+            # параллельный запрос, add не сработает.
+            if cache.add(key, 1, period + 1):
+                return 1
+            return cache.incr(key)
+
+    def wait(self):
+        return self.reset
+
+
+class RateLimitHeadersMixin:
+    """Заголовки X-RateLimit-* для действий с ограничением частоты:
+    лимит, остаток и секунды до пополнения."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response,
+                                             *args, **kwargs)
+        state = getattr(request, 'rate_limit', None)
+        # Ответ из микрокэша nginx получат и другие клиенты.
+        if state is not None and 'X-Accel-Expires' not in response:
+            limit, remaining, reset = state
+            response['X-RateLimit-Limit'] = limit
+            response['X-RateLimit-Remaining'] = remaining
+            response['X-RateLimit-Reset'] = math.ceil(reset)
+        return response
@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import SimpleRouter
 
 from .views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                    TagViewSet)
+                    SyncView, TagViewSet)
 
 router = SimpleRouter()
 router.register('tags', TagViewSet, basename='tags')
@@ -12,6 +12,7 @@ router.register('users', CustomUserViewSet, basename='users')
 
 
 urlpatterns = [
+    path('sync/', SyncView.as_view(), name='sync'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include('djoser.urls'))
@@ -1,44 +1,108 @@
-from django.db.models import Sum
-from django.shortcuts import HttpResponse, get_object_or_404
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes import (deletion, feed, invalidation, ndjson, outbox, shopping,
+                     sync)
+from recipes.models import (SERVINGS_MAX, ChangeLog, Favorite, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart, Tag)
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from users.models import Subscription, User
 
+from . import downloads
+from .conditional import ConditionalGetMixin
 from .filters import IngredientFilter, RecipeFilter
+from .multiget import MultiGetMixin
+from .paginations import FeedCursorPagination
 from .permissions import IsOwnerOrAdminOrReadOnly
 from .serializers import (FavoriteSerializer, IngredientSerializer,
                           RecipeCreateSerializer, RecipeReadSerializer,
                           RecipeUpdateSerializer, ShoppingCartSerializer,
                           SubscriptionSerializer, SubscriptionsSerializer,
-                          TagSerialiser)
+                          SubscritionRecipeSerializer, TagSerialiser)
+from .throttling import RateLimitHeadersMixin
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class SparseFieldsetViewMixin:
+    """Параметры запроса для сокращённых ответов:
+    ?fields=id,name - оставить только перечисленные поля;
+    ?expand=author - раскрыть только перечисленные связи,
+    остальные отдаются как id;
+    ?view=card - набор полей из fieldset_views."""
+
+    fieldset_views = {}
+
+    def get_fieldset(self):
+        if self.request is None:
+            return None, None
+        params = self.request.query_params
+        fields, expand = self.fieldset_views.get(params.get('view'),
+                                                 (None, None))
+        if params.get('fields'):
+            fields = set(params['fields'].split(','))
+        if 'expand' in params:
+            expand = set(filter(None, params['expand'].split(',')))
+        return fields, expand
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self.get_fieldset()
+        return context
+
+
+class CatalogueCacheMixin:
+    """Список без параметров запроса хранится в кэше процесса,
+    пока не изменятся наборы данных из version_names."""
+
+    def list(self, request, *args, **kwargs):
+        handler = super().list
+        if request.query_params:
+            return handler(request, *args, **kwargs)
+        data = invalidation.catalogue_cache.get_or_set(
+            self.basename, self.version_names,
+            lambda: list(handler(request, *args, **kwargs).data))
+        return Response(data)
+
+
+class TagViewSet(ConditionalGetMixin, CatalogueCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """Вьюсет для TaSerialiser."""
 
+    version_names = ('tags',)
+    micro_cache = True
     queryset = Tag.objects.all()
     serializer_class = TagSerialiser
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(RateLimitHeadersMixin, ConditionalGetMixin,
+                        CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для IngredientSerializer."""
 
+    version_names = ('ingredients',)
+    micro_cache = True
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientFilter
+    throttle_scopes = {'list': 'autocomplete'}
+    query_budgets = {'list': 3}
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(RateLimitHeadersMixin, ConditionalGetMixin,
+                    MultiGetMixin, SparseFieldsetViewMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет для RecipeReadSerializer - чтение,
     RecipeWriteSerializer - запись данных."""
 
@@ -47,9 +111,85 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    fieldset_views = {
+        'card': ({'id', 'tags', 'author', 'is_favorited',
+                  'is_in_shopping_cart', 'name', 'image', 'cooking_time'},
+                 {'tags', 'author'}),
+    }
+    version_names = ('recipes', 'tags', 'ingredients', 'users')
+    per_user_version = True
+    micro_cache = True
+    throttle_scopes = {
+        'create': 'recipe_write',
+        'partial_update': 'recipe_write',
+        'download_shopping_cart': 'shopping_list',
+        'shopping_plan': 'shopping_list',
+        'favorite': 'toggle',
+        'shopping_cart': 'toggle',
+    }
+    # Наибольшее число SQL-запросов действия, см. api/querycheck.py.
+    query_budgets = {
+        'list': 8,
+        'retrieve': 7,
+        'feed': 7,
+        'download_shopping_cart': 3,
+        'shopping_plan': 3,
+    }
+
+    def get_version_names(self, request):
+        names = super().get_version_names(request)
+        if self.action == 'retrieve':
+            names.remove('recipes')
+        return names
+
+    def get_extra_stamps(self):
+        if self.action != 'retrieve':
+            return []
+        updated_at = Recipe.objects.filter(
+            pk=self.kwargs[self.lookup_field]).values_list(
+                'updated_at', flat=True).first()
+        if updated_at is None:
+            return None
+        return [(f'recipe={updated_at.isoformat()}', updated_at)]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve', 'feed'):
+            return queryset
+        fields, expand = self.get_fieldset()
+
+        def requested(name):
+            return fields is None or name in fields
+
+        queryset = queryset.defer(
+            'search_vector', 'is_favorited', 'is_in_shopping_cart',
+            *(name for name in ('name', 'image', 'text', 'cooking_time')
+              if not requested(name)))
+        if requested('author') and (expand is None or 'author' in expand):
+            queryset = queryset.select_related('author')
+        if requested('tags'):
+            queryset = queryset.prefetch_related('tags')
+        if requested('ingredients'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'ingredient_recipe',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient')))
+        user = self.request.user
+        if user.is_authenticated:
+            # Флаги пользователя одним запросом со списком,
+            # а не exists() на каждый рецепт.
+            if requested('is_favorited'):
+                queryset = queryset.annotate(user_favorited=Exists(
+                    Favorite.objects.filter(user=user,
+                                            recipe=OuterRef('pk'))))
+            if requested('is_in_shopping_cart'):
+                queryset = queryset.annotate(user_in_cart=Exists(
+                    ShoppingCart.objects.filter(user=user,
+                                                recipe=OuterRef('pk'))))
+        return queryset
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeReadSerializer
         if self.action in ('update', 'partial_update'):
             return RecipeUpdateSerializer
@@ -58,53 +198,139 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         return serializer.save(author=self.request.user)
 
-    def _post_delete_methods(self, request, model, serializer, pk):
+    def perform_destroy(self, instance):
+        deletion.delete_recipes(Recipe.objects.filter(id=instance.id))
+
+    def _post_delete_methods(self, request, model, serializer, pk,
+                             topic=None):
+        """Добавление и удаление связи пользователя с рецептом.
+        topic - событие outbox об изменении. Ключ события строится
+        по строке связи, поэтому повтор публикации не создаёт дубль."""
         user = self.request.user
         recipe = get_object_or_404(Recipe, id=pk)
+        payload = {'user_id': user.id, 'recipe_id': recipe.id}
         if request.method == 'POST':
             serializer = serializer(
                 data=request.data,
                 context={'request': request,
                          'recipe': recipe})
             if serializer.is_valid(raise_exception=True):
-                serializer.save(recipe=recipe, user=user)
+                with transaction.atomic():
+                    row = serializer.save(recipe=recipe, user=user)
+                    if topic:
+                        outbox.publish(topic, {**payload, 'added': True},
+                                       key=f'{row.id}:created')
                 return Response(serializer.data,
                                 status=status.HTTP_201_CREATED)
         if request.method == 'DELETE':
-            if model.objects.filter(recipe=recipe, user=user).exists():
-                model.objects.get(recipe=recipe).delete()
+            row_id = model.objects.filter(
+                recipe=recipe, user=user).values_list('id', flat=True).first()
+            if row_id is not None:
+                with transaction.atomic():
+                    model.objects.filter(id=row_id).delete()
+                    if topic:
+                        outbox.publish(topic, {**payload, 'added': False},
+                                       key=f'{row_id}:deleted')
                 return Response('Успешное удаление!',
                                 status=status.HTTP_204_NO_CONTENT)
             return Response({'errors': 'Объект не найден'},
                             status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(permissions.IsAuthenticated,),
+            pagination_class=FeedCursorPagination)
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+
+        queryset = feed.filter_feed(self.get_queryset(), request.user)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(permissions.IsAdminUser,))
+    def export(self, request):
+        """Потоковая выгрузка всех рецептов в NDJSON."""
+
+        response = StreamingHttpResponse(ndjson.export_lines(),
+                                         content_type='application/x-ndjson')
+        response['Content-Disposition'] = \
+            'attachment; filename="recipes.ndjson"'
+        return response
+
+    @action(detail=False,
+            methods=['post'],
+            url_path='import',
+            permission_classes=(permissions.IsAdminUser,))
+    def import_recipes(self, request):
+        """Загрузка рецептов из тела запроса в NDJSON построчно."""
+
+        importer = ndjson.Importer()
+        stats = importer.run(request._request)
+        return Response({**stats, 'error_details': importer.errors},
+                        status=status.HTTP_200_OK)
+
     @action(detail=False,
             methods=['get'],
             permission_classes=(permissions.IsAuthenticated,))
     def download_shopping_cart(self, request):
         """Отправка файла со списком покупок."""
 
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shopping_cart__user=self.request.user).values(
-                'ingredient__name', 'ingredient__measurement_unit').annotate(
-                    ingredient_amount=Sum('amount'))
-        shopping_list = ['Список покупок:\n']
-        for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
-            amount = ingredient['ingredient_amount']
-            shopping_list.append(f'\n{name} - {amount}, {unit}')
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = \
-            'attachment; filename="shopping_cart.txt"'
-        return response
+        plan = shopping.cart_plan(self.request.user)
+        return downloads.attachment(shopping.as_text(plan).encode(),
+                                    'shopping_cart.txt', 'text/plain')
 
-    @action(methods=['post', 'delete'],
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(permissions.IsAuthenticated,))
+    def shopping_plan(self, request):
+        """Суммарное количество ингредиентов с учётом порций:
+        для корзины или для рецептов из ?recipes=3:2,5,8:0.5
+        (id рецепта и множитель, по умолчанию 1)."""
+
+        servings = self._servings_param()
+        if servings is None:
+            return Response(shopping.cart_plan(request.user))
+        return Response(shopping.recipes_plan(servings))
+
+    def _servings_param(self):
+        value = self.request.query_params.get('recipes')
+        if value is None:
+            return None
+        field = ShoppingCart._meta.get_field('servings')
+        servings = {}
+        try:
+            for item in filter(None, map(str.strip, value.split(','))):
+                recipe_id, _, multiplier = item.partition(':')
+                multiplier = field.clean(multiplier or '1', None)
+                servings[int(recipe_id)] = multiplier
+        except (ArithmeticError, ValueError, DjangoValidationError):
+            raise ValidationError(
+                {'recipes': 'Ожидается список id[:множитель] через '
+                            f'запятую, множитель от 0.1 до {SERVINGS_MAX}.'})
+        if not servings or len(servings) > self.multi_get_max:
+            raise ValidationError(
+                {'recipes': f'Укажите от 1 до {self.multi_get_max} '
+                            'рецептов.'})
+        return servings
+
+    @action(methods=['post', 'patch', 'delete'],
             detail=True,
             permission_classes=(permissions.IsAuthenticated,))
     def shopping_cart(self, request, pk):
         shopping_cart = ShoppingCart
         serializer = ShoppingCartSerializer
+        if request.method == 'PATCH':
+            instance = get_object_or_404(ShoppingCart, recipe_id=pk,
+                                         user=request.user)
+            serializer = serializer(instance, data=request.data,
+                                    partial=True,
+                                    context={'request': request})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(serializer.data)
         return self._post_delete_methods(request,
                                          shopping_cart,
                                          serializer,
@@ -116,23 +342,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def favorite(self, request, pk):
         favorite = Favorite
         serializer = FavoriteSerializer
-        return self._post_delete_methods(request, favorite, serializer, pk)
+        return self._post_delete_methods(request, favorite, serializer, pk,
+                                         topic='favorite.changed')
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(RateLimitHeadersMixin, MultiGetMixin,
+                        SparseFieldsetViewMixin, UserViewSet):
     """Вьюсет для SubscriptionSerializer."""
 
     queryset = User.objects.all()
+    throttle_scopes = {'create': 'signup', 'subscribe': 'toggle'}
+    query_budgets = {'list': 5, 'retrieve': 4, 'me': 3, 'subscriptions': 6}
+
+    def perform_destroy(self, instance):
+        deletion.delete_users(User.objects.filter(id=instance.id))
 
     @action(methods=['get'],
             detail=False,
             permission_classes=(permissions.IsAuthenticated,))
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
+        recipes = Recipe.objects.only('id', 'author_id', 'name', 'image',
+                                      'cooking_time')
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            # Первые recipes_limit рецептов каждого автора страницы
+            # одним запросом.
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(author=OuterRef('author_id')).values(
+                    'id')[:int(recipes_limit)]))
+        queryset = User.objects.filter(
+            following__user=request.user).prefetch_related(
+                Prefetch('recipes', queryset=recipes))
         pages = self.paginate_queryset(queryset)
-        serializer = SubscriptionsSerializer(pages,
-                                             many=True,
-                                             context={'request': request})
+        serializer = SubscriptionsSerializer(
+            pages, many=True, context=self.get_serializer_context())
         return self.get_paginated_response(serializer.data)
 
     @action(methods=['post', 'delete'],
@@ -147,13 +390,70 @@ class CustomUserViewSet(UserViewSet):
                 context={'request': request,
                          'author': author})
             if serializer.is_valid(raise_exception=True):
-                serializer.save(author=author, user=user)
+                with transaction.atomic():
+                    subscription = serializer.save(author=author, user=user)
+                    outbox.publish('subscription.created',
+                                   {'user_id': user.id,
+                                    'author_id': author.id},
+                                   key=f'{subscription.id}:created')
                 return Response(serializer.data,
                                 status=status.HTTP_201_CREATED)
         if request.method == 'DELETE':
-            if Subscription.objects.filter(author=author, user=user).exists():
-                Subscription.objects.get(author=author).delete()
+            subscription_id = Subscription.objects.filter(
+                author=author, user=user).values_list('id', flat=True).first()
+            if subscription_id is not None:
+                with transaction.atomic():
+                    Subscription.objects.filter(id=subscription_id).delete()
+                    outbox.publish('subscription.deleted',
+                                   {'user_id': user.id,
+                                    'author_id': author.id},
+                                   key=f'{subscription_id}:deleted')
                 return Response('Успешная отписка!',
                                 status=status.HTTP_204_NO_CONTENT)
             return Response({'errors': 'Объект не найден'},
                             status=status.HTTP_404_NOT_FOUND)
+
+
+class SyncView(APIView):
+    """Изменения избранного, корзины, подписок и своих рецептов
+    после курсора: GET /api/sync/?since=<cursor>.
+    Без since (или с устаревшим курсором) возвращает reset=true
+    и текущий курсор: клиент загружает списки целиком.
+    Для избранного, корзины и рецептов к upsert прикладывается
+    краткое описание рецепта."""
+
+    permission_classes = (permissions.IsAuthenticated,)
+    recipe_entities = (sync.FAVORITE, sync.SHOPPING_CART, sync.RECIPE)
+
+    def get(self, request):
+        since = self._int_param('since')
+        limit = self._int_param('limit')
+        if limit is not None:
+            limit = min(limit, settings.SYNC_PAGE_SIZE) or None
+        result = sync.changes_since(request.user, since, limit)
+        recipe_ids = {change['id'] for change in result['changes']
+                      if change['entity'] in self.recipe_entities
+                      and change['action'] == ChangeLog.UPSERT}
+        recipes = {recipe.id: recipe for recipe in Recipe.objects.filter(
+            id__in=recipe_ids)} if recipe_ids else {}
+        context = {'request': request}
+        for change in result['changes']:
+            recipe = (recipes.get(change['id'])
+                      if change['entity'] in self.recipe_entities
+                      and change['action'] == ChangeLog.UPSERT else None)
+            change['data'] = (SubscritionRecipeSerializer(
+                recipe, context=context).data if recipe else None)
+        return Response(result)
+
+    def _int_param(self, name):
+        value = self.request.query_params.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            value = -1
+        if value < 0:
+            raise ValidationError(
+                {name: 'Ожидается неотрицательное целое число.'})
+        return value
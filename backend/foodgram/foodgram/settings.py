@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -13,7 +14,7 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'default')
 DEBUG = False
 
 ALLOWED_HOSTS = ['linaartfoodgram.sytes.net', '158.160.30.28',
-                 'localhost', '127.0.0.1']
+                 'localhost', '127.0.0.1', 'backend']
 
 
 INSTALLED_APPS = [
@@ -33,13 +34,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'api.middleware.BrowserSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.BrowserCsrfViewMiddleware',
+    'api.middleware.BrowserAuthenticationMiddleware',
+    'api.middleware.BrowserMessageMiddleware',
+    'api.middleware.BrowserXFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -64,7 +68,7 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
@@ -118,6 +122,30 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginations.PageLimitPagination',
     'PAGE_SIZE': 6,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.ActionRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'autocomplete': os.getenv('THROTTLE_AUTOCOMPLETE', '300/min'),
+        'recipe_write': os.getenv('THROTTLE_RECIPE_WRITE', '30/hour'),
+        'shopping_list': os.getenv('THROTTLE_SHOPPING_LIST', '10/min'),
+        'toggle': os.getenv('THROTTLE_TOGGLE', '120/min'),
+        'signup': os.getenv('THROTTLE_SIGNUP', '10/hour'),
+    },
+    # IP клиента для лимитов анонимов: nginx заменяет
+    # X-Forwarded-For адресом клиента.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+}
+
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'True') == 'True'
+THROTTLE_CACHE = 'default'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND',
+                             'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
 }
 
 DJOSER = {
@@ -133,3 +161,93 @@ DJOSER = {
         'user': ['djoser.permissions.CurrentUserOrAdminOrReadOnly'],
     }
 }
+
+# Запросы к API по токену не проходят через сессии, CSRF и сообщения.
+API_LEAN_MIDDLEWARE = os.getenv('API_LEAN_MIDDLEWARE', 'True') == 'True'
+API_PATH_PREFIX = '/api/'
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_LOG_JSON = os.getenv('METRICS_LOG_JSON', 'False') == 'True'
+METRICS_SLOW_REQUEST_MS = int(os.getenv('METRICS_SLOW_REQUEST_MS', 1000))
+# Общий каталог метрик воркеров одного сервера, пусто - метрики
+# каждого воркера отдельно.
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics'))
+METRICS_FLUSH_SECONDS = int(os.getenv('METRICS_FLUSH_SECONDS', 5))
+METRICS_OUTBOX_CACHE_SECONDS = int(
+    os.getenv('METRICS_OUTBOX_CACHE_SECONDS', 15))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_DIR = os.getenv(
+    'PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-profiles'))
+PROFILING_MAX_RECORDS = int(os.getenv('PROFILING_MAX_RECORDS', 50))
+PROFILING_TOKEN_MAX_AGE = int(os.getenv('PROFILING_TOKEN_MAX_AGE', 3600))
+
+QUERY_INSPECTOR = os.getenv('QUERY_INSPECTOR', 'off')
+QUERY_N_PLUS_ONE_THRESHOLD = int(os.getenv('QUERY_N_PLUS_ONE_THRESHOLD', 3))
+
+FEED_FANOUT_BATCH_SIZE = int(os.getenv('FEED_FANOUT_BATCH_SIZE', 1000))
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 5000))
+FEED_BACKFILL_LIMIT = int(os.getenv('FEED_BACKFILL_LIMIT', 50))
+FEED_HOT_AUTHORS_TTL = int(os.getenv('FEED_HOT_AUTHORS_TTL', 60))
+
+INVALIDATION_BUS = os.getenv('INVALIDATION_BUS', 'postgres')
+INVALIDATION_RESYNC_INTERVAL = int(
+    os.getenv('INVALIDATION_RESYNC_INTERVAL', 30))
+LOCAL_CACHE_ENABLED = os.getenv('LOCAL_CACHE_ENABLED', 'True') == 'True'
+LOCAL_CACHE_MAX_ENTRIES = int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', 10000))
+
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(
+    os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000))
+
+OUTBOX_EAGER = os.getenv('OUTBOX_EAGER', 'False') == 'True'
+OUTBOX_WORKER_THREADS = int(os.getenv('OUTBOX_WORKER_THREADS', 2))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 1))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_RETRY_DELAY = int(os.getenv('OUTBOX_RETRY_DELAY', 5))
+OUTBOX_MAX_RETRY_DELAY = int(os.getenv('OUTBOX_MAX_RETRY_DELAY', 600))
+OUTBOX_RETENTION_HOURS = int(os.getenv('OUTBOX_RETENTION_HOURS', 72))
+
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 500))
+SYNC_SETTLE_SECONDS = int(os.getenv('SYNC_SETTLE_SECONDS', 5))
+SYNC_RETENTION_DAYS = int(os.getenv('SYNC_RETENTION_DAYS', 30))
+
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 500))
+PURGE_BATCHES_PER_RUN = int(os.getenv('PURGE_BATCHES_PER_RUN', 20))
+
+CART_RETENTION_DAYS = int(os.getenv('CART_RETENTION_DAYS', 90))
+CART_PURGE_BATCH_SIZE = int(os.getenv('CART_PURGE_BATCH_SIZE', 1000))
+CART_PURGE_PAUSE = float(os.getenv('CART_PURGE_PAUSE', 0.5))
+
+PUSH_BACKEND = os.getenv('PUSH_BACKEND', 'postgres')
+SSE_PATH = '/api/events/'
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+SSE_BUFFER_SIZE = int(os.getenv('SSE_BUFFER_SIZE', 100))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 3000))
+
+MICRO_CACHE_SECONDS = int(os.getenv('MICRO_CACHE_SECONDS', 5))
+ACCEL_REDIRECT_ENABLED = os.getenv('ACCEL_REDIRECT_ENABLED',
+                                   'False') == 'True'
+ACCEL_REDIRECT_PREFIX = '/protected/downloads/'
+DOWNLOADS_DIR = os.getenv('DOWNLOADS_DIR', '/downloads/')
+DOWNLOADS_MAX_AGE = int(os.getenv('DOWNLOADS_MAX_AGE', 3600))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': os.getenv('API_LOG_LEVEL', 'INFO'),
+        },
+        'recipes': {
+            'handlers': ['console'],
+            'level': os.getenv('API_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
@@ -0,0 +1,105 @@
+"""Прогрев приложения при запуске gunicorn.
+
+С preload_app прогрев выполняется один раз в мастере до fork,
+и воркеры получают готовые объекты как общие страницы памяти."""
+
+import logging
+import sys
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
+from django.utils import translation
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(timings, name, func):
+    start = time.perf_counter()
+    func()
+    timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def _warm_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict
+    for pattern in resolver.url_patterns:
+        getattr(pattern, 'url_patterns', None)
+
+
+def _warm_translations():
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('This field is required.')
+
+
+def _warm_serializers():
+    from api import serializers as api_serializers
+
+    for value in vars(api_serializers).values():
+        if (isinstance(value, type)
+                and issubclass(value, serializers.Serializer)
+                and value.__module__ == api_serializers.__name__):
+            try:
+                value(context={}).fields
+            except Exception:
+                continue
+
+
+def _warm_catalogue():
+    from api.serializers import IngredientSerializer, TagSerialiser
+    from recipes.invalidation import catalogue_cache
+    from recipes.models import Ingredient, Tag
+
+    for key, queryset, serializer in (
+            ('tags', Tag.objects.all(), TagSerialiser),
+            ('ingredients', Ingredient.objects.all(), IngredientSerializer)):
+        catalogue_cache.preload(
+            key, (key,), list(serializer(queryset, many=True).data))
+
+
+def warm_up():
+    """Прогревает то, что иначе делал бы первый запрос каждого воркера:
+    URL-резолвер, переводы, поля сериализаторов и каталог тегов
+    и ингредиентов. Соединения с БД закрываются, чтобы воркеры
+    не унаследовали общий сокет. Возвращает время этапов в мс."""
+    timings = {}
+    _timed(timings, 'urls_ms', _warm_urls)
+    _timed(timings, 'translations_ms', _warm_translations)
+    _timed(timings, 'serializers_ms', _warm_serializers)
+    try:
+        _timed(timings, 'catalogue_ms', _warm_catalogue)
+    except DatabaseError as error:
+        # БД ещё не мигрирована или недоступна: мастер gunicorn
+        # должен запуститься, каталог загрузит первый запрос.
+        logger.warning('Каталог не прогрет: %s', error)
+    finally:
+        connections.close_all()
+    return timings
+
+
+def memory_usage():
+    """Память процесса в МБ из /proc/self/smaps_rollup (Linux):
+    rss - всего, pss - с долей общих страниц, private - только своя."""
+    try:
+        with open('/proc/self/smaps_rollup') as file:
+            lines = file.readlines()
+    except OSError:
+        return {}
+    values = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) == 3 and parts[2] == 'kB':
+            values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss_mb': round(values.get('Rss', 0) / 1024, 1),
+        'pss_mb': round(values.get('Pss', 0) / 1024, 1),
+        'private_mb': round((values.get('Private_Clean', 0)
+                             + values.get('Private_Dirty', 0)) / 1024, 1),
+    }
+
+
+def heavy_modules():
+    """Тяжёлые модули, которые должны загружаться только по требованию."""
+    return [name for name in ('PIL', 'PIL.Image') if name in sys.modules]
@@ -1,11 +1,18 @@
+from api.metrics import metrics_view
+from api.profiling import profile_detail, profile_list
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
 urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(profile_list),
+         name='profiles'),
+    path('admin/profiles/<slug:profile_id>/',
+         admin.site.admin_view(profile_detail), name='profile-detail'),
     path('admin/', admin.site.urls),
-    path('api/', include('api.urls'))
+    path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
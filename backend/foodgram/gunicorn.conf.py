@@ -0,0 +1,68 @@
+"""Настройки gunicorn.
+
+При GUNICORN_PRELOAD=True Django загружается и прогревается один раз
+в мастере, затем объекты переносятся в постоянное поколение сборщика
+мусора (gc.freeze), чтобы он не трогал их страницы и воркеры делили
+их с мастером после fork. Время запуска и память каждого воркера
+пишутся в лог.
+
+Каталог метрик воркеров (METRICS_DIR) очищается при запуске сервера,
+воркер при завершении сохраняет туда последние значения."""
+
+import gc
+import os
+import shutil
+import tempfile
+import time
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 3))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+metrics_dir = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-metrics'))
+
+_boot_started = time.perf_counter()
+
+
+def _warm_up(log, who):
+    from foodgram.startup import heavy_modules, memory_usage, warm_up
+
+    timings = warm_up()
+    log.info('%s: прогрев %s, загружено за %.2f с, память %s, '
+             'тяжёлые модули: %s', who, timings,
+             time.perf_counter() - _boot_started, memory_usage(),
+             heavy_modules() or 'нет')
+
+
+def on_starting(server):
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    _warm_up(server.log, 'master')
+    gc.collect()
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    worker.fork_started = time.perf_counter()
+
+
+def post_worker_init(worker):
+    from foodgram.startup import memory_usage
+
+    if not preload_app:
+        _warm_up(worker.log, f'worker {worker.pid}')
+    worker.log.info('worker %s: готов через %.3f с после fork, память %s',
+                    worker.pid,
+                    time.perf_counter() - worker.fork_started,
+                    memory_usage())
+
+
+def worker_exit(server, worker):
+    from api.metrics import registry
+
+    registry.flush()
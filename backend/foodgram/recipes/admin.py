@@ -1,81 +1,176 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import Count
+from django.forms.models import BaseInlineFormSet
 
-from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingCart, Tag, TagRecipe)
+from .deletion import SoftDeleteAdminMixin, delete_recipes
+from .models import (Favorite, Ingredient, IngredientRecipe, OutboxEvent,
+                     Recipe, ShoppingCart, Tag, TagRecipe)
+from .paginators import EstimatedCountPaginator
 
 
-class IngredientsInline(admin.TabularInline):
+class LargeTableAdmin(admin.ModelAdmin):
+    """Базовая админ-зона для больших таблиц: оценка числа строк
+    вместо COUNT(*) и без второго подсчёта при фильтрации."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class PreloadedAutocompleteSelect(AutocompleteSelect):
+    """Автодополнение, которое берёт выбранный объект из строки
+    инлайна, загруженной через select_related, а не отдельным
+    запросом на каждую форму."""
+
+    selected_object = None
+
+    def optgroups(self, name, value, attr=None):
+        obj = self.selected_object
+        if obj is None or {str(item) for item in value} != {str(obj.pk)}:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name, obj.pk, self.choices.field.label_from_instance(obj),
+            True, len(options)))
+        return [(None, options, 0)]
+
+
+class PreloadedInlineFormSet(BaseInlineFormSet):
+    """Передаёт виджетам автодополнения объекты строк формсета."""
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        if form.instance.pk is None:
+            return form
+        for name, field in form.fields.items():
+            widget = getattr(field.widget, 'widget', field.widget)
+            if isinstance(widget, PreloadedAutocompleteSelect):
+                widget.selected_object = getattr(form.instance, name)
+        return form
+
+
+class PreloadedInline(admin.TabularInline):
+    """Инлайн без запроса на каждую строку: связанные объекты
+    загружаются с формсетом, поля autocomplete_fields
+    используют PreloadedAutocompleteSelect."""
+
+    formset = PreloadedInlineFormSet
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = PreloadedAutocompleteSelect(
+                db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class IngredientsInline(PreloadedInline):
     """Админ-зона для добавления ингредиентов в рецепты."""
 
     model = IngredientRecipe
+    autocomplete_fields = ('ingredient',)
     extra = 3
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient')
 
-class TagsInline(admin.TabularInline):
+
+class TagsInline(PreloadedInline):
     """Админ-зона для добавления тегов в рецепты."""
 
     model = TagRecipe
+    autocomplete_fields = ('tag',)
     extra = 3
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('recipe', 'tag')
+
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     """Админ-зона избранных рецептов."""
 
     list_display = ('user', 'recipe')
-    list_filter = ('user',)
-    search_fields = ('user',)
+    list_select_related = ('user', 'recipe')
+    raw_id_fields = ('user', 'recipe')
+    search_fields = ('user__email', 'recipe__name')
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdmin):
     """Админ-зона списка покупок."""
 
-    list_display = ('user', 'recipe')
-    list_filter = ('user',)
-    search_fields = ('user',)
+    list_display = ('user', 'recipe', 'servings', 'updated_at')
+    list_select_related = ('user', 'recipe')
+    raw_id_fields = ('user', 'recipe')
+    search_fields = ('user__email', 'recipe__name')
 
 
 @admin.register(IngredientRecipe)
-class IngredientRecipeAdmin(admin.ModelAdmin):
+class IngredientRecipeAdmin(LargeTableAdmin):
     """Админ-зона ингредиентов для рецептов."""
 
     list_display = ('id', 'recipe', 'ingredient', 'amount',)
-    list_filter = ('recipe', 'ingredient')
-    search_fields = ('name',)
+    list_select_related = ('recipe', 'ingredient')
+    raw_id_fields = ('recipe',)
+    autocomplete_fields = ('ingredient',)
+    search_fields = ('recipe__name', 'ingredient__name')
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(SoftDeleteAdminMixin, LargeTableAdmin):
     """Админ-зона рецептов."""
 
-    list_display = ('id', 'author', 'name')
-    search_fields = ('name',)
-    list_filter = ('author', 'name', 'tags')
-    filter_horizontal = ('ingredients',)
-    filter_vertical = ('tags',)
+    soft_delete = staticmethod(delete_recipes)
+
+    list_display = ('id', 'author', 'name', 'in_favorite')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__email')
+    list_filter = ('tags',)
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
     inlines = [IngredientsInline, TagsInline]
 
+    @admin.display(description='Добавленные рецепты в избранное',
+                   ordering='favorites_count')
     def in_favorite(self, obj):
-        return obj.favorite.all().count()
-
-    in_favorite.short_description = 'Добавленные рецепты в избранное'
+        return obj.favorites_count
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     """Админ-зона тегов."""
 
-    list_display = ('id', 'name', 'slug', 'color')
+    list_display = ('id', 'name', 'slug', 'color', 'recipes_count')
     list_filter = ('name',)
     search_fields = ('name',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=Count('tag_recipe'))
+
+    @admin.display(description='Рецептов', ordering='recipes_count')
+    def recipes_count(self, obj):
+        return obj.recipes_count
+
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     """Админ-зона ингридиентов."""
 
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     search_fields = ('name',)
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(LargeTableAdmin):
+    """Админ-зона событий outbox."""
+
+    list_display = ('id', 'topic', 'created_at', 'attempts', 'processed_at')
+    list_filter = ('topic',)
+    search_fields = ('idempotency_key',)
+    readonly_fields = ('topic', 'payload', 'idempotency_key', 'created_at',
+                       'attempts', 'last_error', 'processed_at')
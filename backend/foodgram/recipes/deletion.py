@@ -0,0 +1,201 @@
+"""Удаление рецептов и пользователей в два этапа.
+
+Запрос только помечает строки (deleted_at): менеджеры objects их
+больше не возвращают, а уникальные поля освобождаются сразу.
+Связанные строки, сами рецепты и пользователи и файлы изображений
+удаляет purge пачками по PURGE_BATCH_SIZE, каждая в своей
+транзакции, - без обхода всего каскада сборщиком Django в запросе."""
+
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import CharField, Exists, OuterRef, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from users.models import Subscription, User
+
+from . import outbox, sync
+from .models import (SEARCH_FTS_TABLE, ChangeLog, Favorite, IngredientRecipe,
+                     Recipe, ShoppingCart, TagRecipe, TimelineEntry, Version)
+
+logger = logging.getLogger(__name__)
+
+
+def delete_recipes(queryset):
+    """Помечает рецепты удалёнными одним UPDATE.
+    content_hash заменяется, чтобы рецепт можно было создать заново."""
+    rows = list(queryset.filter(deleted_at__isnull=True).values_list(
+        'id', 'author_id'))
+    if not rows:
+        return 0
+    with transaction.atomic():
+        queryset.filter(deleted_at__isnull=True).update(
+            deleted_at=timezone.now(),
+            content_hash=Concat(Value('deleted:'),
+                                Cast('id', output_field=CharField())))
+        sync.record_many(sync.RECIPE,
+                         [(author_id, recipe_id)
+                          for recipe_id, author_id in rows],
+                         ChangeLog.DELETE)
+        outbox.publish_many('recipe.deleted', [
+            (f'{recipe_id}:deleted',
+             {'recipe_id': recipe_id, 'author_id': author_id})
+            for recipe_id, author_id in rows])
+        Version.objects.bump('recipes')
+    return len(rows)
+
+
+def delete_users(queryset):
+    """Помечает пользователей удалёнными вместе с их рецептами.
+    Личные данные обезличиваются, токены удаляются сразу."""
+    user_ids = list(queryset.filter(deleted_at__isnull=True).values_list(
+        'id', flat=True))
+    if not user_ids:
+        return 0
+    with transaction.atomic():
+        for user_id in user_ids:
+            User.objects.filter(id=user_id).update(
+                deleted_at=timezone.now(),
+                is_active=False,
+                email=f'deleted-{user_id}@deleted.invalid',
+                username=f'deleted-{user_id}')
+        Token.objects.filter(user_id__in=user_ids).delete()
+        delete_recipes(Recipe.objects.filter(author_id__in=user_ids))
+        Version.objects.bump('users')
+    return len(user_ids)
+
+
+def _delete_batch(queryset, batch_size):
+    """Удаляет одну пачку строк queryset. Сигналы моделей
+    (журнал синхронизации, версии кэша) срабатывают как обычно."""
+    with transaction.atomic():
+        ids = list(queryset.order_by('pk').values_list(
+            'pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        queryset.model.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def _delete_images(names):
+    """Удаляет файлы, на которые больше не ссылается ни один рецепт."""
+    names = set(filter(None, names))
+    names -= set(Recipe.all_objects.filter(image__in=names).values_list(
+        'image', flat=True))
+    storage = Recipe._meta.get_field('image').storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception('Не удалось удалить файл %s', name)
+    return len(names)
+
+
+def _delete_recipe_rows(recipes):
+    """Удаляет строки рецептов без сборщика: связанных строк уже нет,
+    а сигналы рецепта (версии, журнал) сработали при пометке."""
+    ids = [recipe_id for recipe_id, _ in recipes]
+    placeholders = ', '.join(['%s'] * len(ids))
+    connection = connections[Recipe.all_objects.db]
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {SEARCH_FTS_TABLE} '
+                           f'WHERE rowid IN ({placeholders})', ids)
+        cursor.execute(f'DELETE FROM {Recipe._meta.db_table} '
+                       f'WHERE id IN ({placeholders})', ids)
+    return len(ids)
+
+
+def _purge_recipes(batch_size, stats):
+    recipes = list(Recipe.all_objects.filter(
+        deleted_at__isnull=False).order_by('id').values_list(
+            'id', 'image')[:batch_size])
+    if not recipes:
+        return False
+    ids = [recipe_id for recipe_id, _ in recipes]
+    for model in (IngredientRecipe, TagRecipe, Favorite, ShoppingCart,
+                  TimelineEntry):
+        while True:
+            deleted = _delete_batch(model.objects.filter(recipe_id__in=ids),
+                                    batch_size)
+            if not deleted:
+                break
+            stats[model._meta.model_name] += deleted
+    stats['recipe'] += _delete_recipe_rows(recipes)
+    stats['image'] += _delete_images(image for _, image in recipes)
+    return True
+
+
+def _purge_user(batch_size, stats):
+    user = User.all_objects.filter(deleted_at__isnull=False).exclude(
+        Exists(Recipe.all_objects.filter(author=OuterRef('pk')))
+    ).order_by('id').first()
+    if user is None:
+        return False
+    # Избранное удалённого пользователя влияет на счётчики рецептов.
+    while True:
+        with transaction.atomic():
+            recipe_ids = list(Favorite.objects.filter(
+                user=user).order_by('pk').values_list(
+                    'recipe_id', flat=True)[:batch_size])
+            if not recipe_ids:
+                break
+            Favorite.objects.filter(user=user,
+                                    recipe_id__in=recipe_ids).delete()
+            outbox.publish_many('favorite.changed', [
+                (f'{user.id}:{recipe_id}:deleted',
+                 {'user_id': user.id, 'recipe_id': recipe_id,
+                  'added': False})
+                for recipe_id in recipe_ids])
+        stats['favorite'] += len(recipe_ids)
+    for model, field in ((ShoppingCart, 'user'), (Subscription, 'user'),
+                         (Subscription, 'author'), (TimelineEntry, 'user'),
+                         (ChangeLog, 'user')):
+        while True:
+            deleted = _delete_batch(model.objects.filter(**{field: user}),
+                                    batch_size)
+            if not deleted:
+                break
+            stats[model._meta.model_name] += deleted
+    User.all_objects.filter(id=user.id).delete()
+    stats['user'] += 1
+    return True
+
+
+def purge(batch_size=None, max_batches=None, progress=None):
+    """Удаляет помеченные рецепты, затем пользователей без рецептов.
+    max_batches ограничивает число пачек за вызов, progress(stats)
+    вызывается после каждой пачки. Возвращает Counter удалённого."""
+    batch_size = batch_size or settings.PURGE_BATCH_SIZE
+    stats = Counter()
+    batches = 0
+    for step in (_purge_recipes, _purge_user):
+        while max_batches is None or batches < max_batches:
+            if not step(batch_size, stats):
+                break
+            batches += 1
+            if progress is not None:
+                progress(stats)
+    return stats
+
+
+class SoftDeleteAdminMixin:
+    """Удаление в админке только помечает строки. Страница
+    подтверждения не обходит каскад связанных объектов."""
+
+    soft_delete = None
+
+    def get_deleted_objects(self, objs, request):
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        return [str(obj) for obj in objs], {}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        self.soft_delete(type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        self.soft_delete(queryset)
@@ -0,0 +1,143 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новый рецепт раскладывается в TimelineEntry подписчиков пачками
+обработчиком outbox после коммита (fan-out-on-write). Рецепты авторов
+с очень большим числом подписчиков не раскладываются, а добавляются
+к ленте при чтении (fan-out-on-read). Когда автор перестаёт быть
+популярным, его последние рецепты раскладываются в ленты всех
+подписчиков (событие author.cooled)."""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from users.models import Subscription
+
+from . import outbox
+from .models import Recipe, TimelineEntry
+
+HOT_AUTHORS_CACHE_KEY = 'feed:hot-authors'
+# Последний вычисленный набор, хранится без срока: по нему
+# находятся авторы, вышедшие из популярных.
+HOT_AUTHORS_SEEN_CACHE_KEY = 'feed:hot-authors:seen'
+
+
+def get_hot_authors():
+    """Авторы, у которых подписчиков больше FEED_FANOUT_MAX_FOLLOWERS."""
+    authors = cache.get(HOT_AUTHORS_CACHE_KEY)
+    if authors is None:
+        authors = set(Subscription.objects.values('author').annotate(
+            followers=Count('id')).filter(
+                followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+            .values_list('author', flat=True))
+        cache.set(HOT_AUTHORS_CACHE_KEY, authors,
+                  settings.FEED_HOT_AUTHORS_TTL)
+        _publish_cooled(authors)
+    return authors
+
+
+def _publish_cooled(authors):
+    """Публикует author.cooled для авторов, которые были в прошлом
+    наборе популярных и выпали из текущего. Процессы, сравнившие
+    с одним и тем же прошлым набором, получают одинаковые ключи."""
+    stamp, seen = cache.get(HOT_AUTHORS_SEEN_CACHE_KEY, (0, set()))
+    cache.set(HOT_AUTHORS_SEEN_CACHE_KEY, (time.time_ns(), authors), None)
+    cooled = seen - authors
+    if cooled:
+        outbox.publish_many('author.cooled', [
+            (f'{author_id}:{stamp}', {'author_id': author_id})
+            for author_id in sorted(cooled)])
+
+
+def is_hot_author(author_id):
+    return author_id in get_hot_authors()
+
+
+def fan_out(recipe_id):
+    """Раскладывает рецепт в ленты подписчиков автора."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'id', 'author_id').first()
+    if recipe is None or is_hot_author(recipe['author_id']):
+        return
+    batch_size = settings.FEED_FANOUT_BATCH_SIZE
+    followers = Subscription.objects.filter(
+        author_id=recipe['author_id']).order_by('user_id').values_list(
+            'user_id', flat=True)
+    last_user_id = 0
+    while True:
+        batch = list(followers.filter(user_id__gt=last_user_id)[:batch_size])
+        if not batch:
+            break
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                           author_id=recipe['author_id'])
+             for user_id in batch],
+            ignore_conflicts=True)
+        last_user_id = batch[-1]
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние рецепты автора,
+    если подписка всё ещё действует."""
+    if (is_hot_author(author_id)
+            or not Subscription.objects.filter(
+                user_id=user_id, author_id=author_id).exists()):
+        return
+    recipe_ids = Recipe.objects.filter(author_id=author_id).order_by(
+        '-id').values_list('id', flat=True)[:settings.FEED_BACKFILL_LIMIT]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                       author_id=author_id)
+         for recipe_id in recipe_ids],
+        ignore_conflicts=True)
+
+
+def backfill_followers(author_id):
+    """Добавляет последние рецепты автора в ленты всех подписчиков:
+    пока автор был популярным, его рецепты не раскладывались."""
+    if is_hot_author(author_id):
+        return
+    recipe_ids = list(Recipe.objects.filter(author_id=author_id).order_by(
+        '-id').values_list('id', flat=True)[:settings.FEED_BACKFILL_LIMIT])
+    if not recipe_ids:
+        return
+    batch_size = max(settings.FEED_FANOUT_BATCH_SIZE // len(recipe_ids), 1)
+    followers = Subscription.objects.filter(
+        author_id=author_id).order_by('user_id').values_list(
+            'user_id', flat=True)
+    last_user_id = 0
+    while True:
+        batch = list(followers.filter(user_id__gt=last_user_id)[:batch_size])
+        if not batch:
+            break
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                           author_id=author_id)
+             for user_id in batch for recipe_id in recipe_ids],
+            ignore_conflicts=True)
+        last_user_id = batch[-1]
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты рецепты автора, если подписки уже нет."""
+    if Subscription.objects.filter(user_id=user_id,
+                                   author_id=author_id).exists():
+        return
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 author_id=author_id).delete()
+
+
+def filter_feed(queryset, user):
+    """Рецепты ленты: разложенные записи и рецепты популярных авторов."""
+    hot_authors = get_hot_authors()
+    if hot_authors:
+        hot_authors = list(Subscription.objects.filter(
+            user=user, author__in=hot_authors).values_list(
+                'author', flat=True))
+    if not hot_authors:
+        return queryset.filter(timeline_entries__user=user)
+    return queryset.filter(
+        Q(id__in=TimelineEntry.objects.filter(user=user).values(
+            'recipe_id'))
+        | Q(author__in=hot_authors))
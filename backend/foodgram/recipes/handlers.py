@@ -0,0 +1,62 @@
+"""Обработчики событий outbox: лента подписок и счётчики.
+
+Счётчики не увеличиваются на единицу, а пересчитываются
+для затронутых объектов пачки, поэтому повторная обработка
+события их не портит."""
+
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from users.models import User
+
+from . import feed, outbox
+from .models import Favorite, Recipe
+
+
+def _count_subquery(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('id')).values('total')), 0)
+
+
+def update_recipes_count(author_ids):
+    User.objects.filter(id__in=author_ids).update(
+        recipes_count=_count_subquery(Recipe.objects.all(), 'author'))
+
+
+def update_favorites_count(recipe_ids):
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        favorites_count=_count_subquery(Favorite.objects.all(), 'recipe'))
+
+
+@outbox.handler('recipe.created')
+def fan_out_recipes(payloads):
+    for payload in payloads:
+        feed.fan_out(payload['recipe_id'])
+
+
+@outbox.handler('recipe.created', 'recipe.deleted')
+def recount_recipes(payloads):
+    update_recipes_count({payload['author_id'] for payload in payloads})
+
+
+@outbox.handler('favorite.changed')
+def recount_favorites(payloads):
+    update_favorites_count({payload['recipe_id'] for payload in payloads})
+
+
+@outbox.handler('subscription.created')
+def backfill_feeds(payloads):
+    for payload in payloads:
+        feed.backfill(payload['user_id'], payload['author_id'])
+
+
+@outbox.handler('author.cooled')
+def backfill_cooled_authors(payloads):
+    for author_id in {payload['author_id'] for payload in payloads}:
+        feed.backfill_followers(author_id)
+
+
+@outbox.handler('subscription.deleted')
+def prune_feeds(payloads):
+    for payload in payloads:
+        feed.prune(payload['user_id'], payload['author_id'])
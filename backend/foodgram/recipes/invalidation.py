@@ -0,0 +1,292 @@
+"""Согласованность локальных кэшей между воркерами.
+
+Каждый воркер gunicorn держит свои кэши в памяти (LocalCache).
+Изменение данных увеличивает счётчик Version, и имена изменённых
+наборов рассылаются всем процессам через шину:
+PostgreSQL LISTEN/NOTIFY или MemoryBus в пределах одного процесса.
+NOTIFY транзакционный, поэтому сообщение уходит только после коммита.
+Записи кэша помнят версии, с которыми были загружены: после
+переподключения и периодически они сверяются с таблицей Version,
+так что потерянные сообщения не оставляют устаревших данных."""
+
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.dispatch import receiver
+
+from .models import Version, versions_bumped
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'foodgram_invalidation'
+
+_caches = []
+
+
+class LocalCache:
+    """LRU-кэш в памяти процесса. Запись зависит от наборов данных
+    (имён Version) и удаляется, когда приходит сообщение о любом
+    из них. Пока шина не подключена, кэш не используется."""
+
+    def __init__(self, name, max_entries=None):
+        self.name = name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+        _caches.append(self)
+
+    def _enabled(self):
+        return settings.LOCAL_CACHE_ENABLED and get_bus().healthy
+
+    def get_many(self, keys):
+        """Возвращает найденные значения и список промахов."""
+        found = {}
+        missing = []
+        enabled = self._enabled()
+        with self._lock:
+            generation = self._generation
+            for key in keys:
+                entry = self._entries.get(key) if enabled else None
+                if entry is None:
+                    missing.append(key)
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[0]
+        return found, missing, generation
+
+    def set_many(self, values, generation):
+        """values: {ключ: (значение, {имя набора: версия})}.
+        Если после чтения generation пришла инвалидация,
+        загруженные данные могли устареть и не сохраняются."""
+        if not self._enabled():
+            return
+        max_entries = self.max_entries or settings.LOCAL_CACHE_MAX_ENTRIES
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries.update(values)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key, names, loader):
+        found, missing, generation = self.get_many([key])
+        if not missing:
+            return found[key]
+        current = stamps(names)
+        versions = {name: current[name].version if name in current else 0
+                    for name in names}
+        value = loader()
+        self.set_many({key: (value, versions)}, generation)
+        return value
+
+    def preload(self, key, names, value):
+        """Сохраняет запись без проверки шины: для прогрева
+        в мастере gunicorn. Версии сверяются в воркере при
+        подключении шины."""
+        current = Version.objects.stamps(names)
+        versions = {name: current[name].version if name in current else 0
+                    for name in names}
+        with self._lock:
+            self._entries[key] = (value, versions)
+
+    def invalidate(self, names):
+        names = set(names)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, (_, versions) in self._entries.items()
+                        if names & versions.keys()]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def names(self):
+        with self._lock:
+            return {name for _, versions in self._entries.values()
+                    for name in versions}
+
+    def drop_outdated(self, current):
+        """Удаляет записи, версии которых отличаются от current."""
+        with self._lock:
+            outdated = [
+                key for key, (_, versions) in self._entries.items()
+                if any(current.get(name, 0) != version
+                       for name, version in versions.items())]
+            if outdated:
+                self._generation += 1
+            for key in outdated:
+                del self._entries[key]
+        return len(outdated)
+
+
+def apply(names):
+    """Применяет сообщение шины ко всем кэшам процесса."""
+    for cache in _caches:
+        cache.invalidate(names)
+
+
+def resync():
+    """Сверяет записи всех кэшей с таблицей Version."""
+    names = set().union(*(cache.names() for cache in _caches))
+    if not names:
+        return 0
+    current = dict(Version.objects.filter(name__in=names).values_list(
+        'name', 'version'))
+    return sum(cache.drop_outdated(current) for cache in _caches)
+
+
+class MemoryBus:
+    """Шина в пределах одного процесса: для тестов, SQLite
+    и runserver. Сообщение применяется после коммита.
+    Изменения других процессов по ней не приходят, поэтому кэши
+    сверяются с таблицей Version при обращении к шине, если с прошлой
+    сверки прошло INVALIDATION_RESYNC_INTERVAL секунд."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._synced_at = None
+
+    @property
+    def healthy(self):
+        if (time.monotonic() - self._synced_at
+                >= settings.INVALIDATION_RESYNC_INTERVAL):
+            # Сверку выполняет один поток, остальные не ждут.
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._resync()
+                finally:
+                    self._lock.release()
+        return True
+
+    def start(self):
+        self._resync()
+
+    def _resync(self):
+        self._synced_at = time.monotonic()
+        resync()
+
+    def publish(self, names):
+        transaction.on_commit(lambda: apply(names))
+
+
+class PostgresBus:
+    """LISTEN/NOTIFY через отдельное соединение в фоновом потоке."""
+
+    def __init__(self, using='default'):
+        self.using = using
+        self.healthy = False
+
+    def start(self):
+        thread = threading.Thread(target=self._listen, daemon=True,
+                                  name='invalidation-listener')
+        thread.start()
+
+    def publish(self, names):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           [CHANNEL, json.dumps(list(names))])
+        # Свой процесс тоже получит NOTIFY, но применяем сразу,
+        # чтобы следующий запрос этого воркера видел изменения.
+        transaction.on_commit(lambda: apply(names))
+
+    def _connect(self):
+        connection = connections[self.using]
+        raw = connection.get_new_connection(
+            connection.get_connection_params())
+        raw.autocommit = True
+        with raw.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return raw
+
+    def _listen(self):
+        interval = settings.INVALIDATION_RESYNC_INTERVAL
+        raw = None
+        while True:
+            try:
+                if raw is None:
+                    raw = self._connect()
+                    # Пока соединения не было, сообщения могли потеряться.
+                    self._resync()
+                    self.healthy = True
+                if select.select([raw], [], [], interval) == ([], [], []):
+                    self._resync()
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    apply(json.loads(raw.notifies.pop(0).payload))
+            except Exception:
+                logger.exception('Шина инвалидации отключилась')
+                self.healthy = False
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+                raw = None
+                threading.Event().wait(interval)
+
+    def _resync(self):
+        close_old_connections()
+        try:
+            dropped = resync()
+        finally:
+            close_old_connections()
+        if dropped:
+            logger.info('Удалено устаревших записей кэша: %s', dropped)
+
+
+_bus = None
+_bus_pid = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    """Шина текущего процесса. Создаётся при первом обращении,
+    после fork (gunicorn --preload) - заново."""
+    global _bus, _bus_pid
+    if _bus is None or _bus_pid != os.getpid():
+        with _bus_lock:
+            if _bus is None or _bus_pid != os.getpid():
+                if (settings.INVALIDATION_BUS == 'postgres'
+                        and connections['default'].vendor == 'postgresql'):
+                    bus = PostgresBus()
+                else:
+                    bus = MemoryBus()
+                # Записи, унаследованные от мастера, проверит resync
+                # при старте шины.
+                bus.start()
+                _bus, _bus_pid = bus, os.getpid()
+    return _bus
+
+
+@receiver(versions_bumped)
+def publish_invalidation(sender, names, **kwargs):
+    get_bus().publish(names)
+
+
+version_cache = LocalCache('versions')
+catalogue_cache = LocalCache('catalogue', max_entries=16)
+
+
+def stamps(names):
+    """Version.objects.stamps с кэшем процесса."""
+    found, missing, generation = version_cache.get_many(names)
+    if missing:
+        loaded = Version.objects.stamps(missing)
+        values = {}
+        for name in missing:
+            stamp = loaded.get(name)
+            found[name] = stamp
+            values[name] = (stamp, {name: stamp.version if stamp else 0})
+        version_cache.set_many(values, generation)
+    return {name: stamp for name, stamp in found.items() if stamp}
@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.ndjson import CHUNK_SIZE, export_lines
+
+
+class Command(BaseCommand):
+    """Выгружает рецепты в NDJSON."""
+
+    help = 'Экспорт рецептов в формате NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help='Файл для выгрузки, по умолчанию stdout')
+        parser.add_argument('--author', default=None,
+                            help='Email автора для выборочной выгрузки')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.all()
+        if options['author']:
+            queryset = queryset.filter(author__email=options['author'])
+        start = time.perf_counter()
+        count = 0
+        output = (sys.stdout if options['output'] == '-'
+                  else open(options['output'], 'w', encoding='utf-8'))
+        try:
+            for line in export_lines(queryset, options['chunk_size']):
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        seconds = time.perf_counter() - start
+        self.stderr.write(
+            f'Выгружено рецептов: {count} за {seconds:.2f} с '
+            f'({count / seconds if seconds else 0:.0f} строк/с)')
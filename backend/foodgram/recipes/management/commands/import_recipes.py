@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from recipes.ndjson import CHUNK_SIZE, Importer
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Загружает рецепты из NDJSON."""
+
+    help = 'Импорт рецептов из NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON или - для stdin')
+        parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--default-author', default=None,
+                            help='Email автора для рецептов, '
+                                 'чей автор не найден')
+
+    def handle(self, *args, **options):
+        default_author = None
+        if options['default_author']:
+            default_author = User.objects.filter(
+                email=options['default_author']).values_list(
+                    'id', flat=True).first()
+            if default_author is None:
+                raise CommandError('Автор по умолчанию не найден.')
+        importer = Importer(options['batch_size'], default_author)
+        if options['path'] == '-':
+            stats = importer.run(sys.stdin)
+        else:
+            with open(options['path'], encoding='utf-8') as file:
+                stats = importer.run(file)
+        for error in importer.errors:
+            self.stderr.write(f'Строка {error["line"]}: {error["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано: {stats["read"]}, создано: {stats["created"]}, '
+            f'дубликатов: {stats["duplicates"]}, '
+            f'ошибок: {stats["errors"]}, '
+            f'{stats["seconds"]} с ({stats["rows_per_second"]} строк/с)'))
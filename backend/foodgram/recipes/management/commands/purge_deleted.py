@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes import deletion
+
+
+class Command(BaseCommand):
+    """Удаляет помеченные рецепты и пользователей пачками."""
+
+    help = ('Удаляет пачками рецепты и пользователей, помеченные '
+            'удалёнными, их связанные строки и файлы изображений')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.PURGE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Остановиться после N пачек')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(stats):
+            self.stdout.write(
+                f'{time.perf_counter() - started:.1f} с: '
+                + ', '.join(f'{name} {count}'
+                            for name, count in sorted(stats.items())))
+
+        stats = deletion.purge(options['batch_size'],
+                               options['max_batches'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено рецептов: {stats["recipe"]}, '
+            f'пользователей: {stats["user"]}, файлов: {stats["image"]}'))
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes import shopping
+
+
+class Command(BaseCommand):
+    """Удаляет устаревшие записи корзин пачками."""
+
+    help = ('Удаляет из корзин рецепты, которые не менялись дольше '
+            'CART_RETENTION_DAYS дней. Можно запускать при работающем '
+            'сайте: пачки короткие, между ними пауза')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.CART_RETENTION_DAYS,
+                            help='Срок хранения, 0 - ничего не удалять')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.CART_PURGE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float,
+                            default=settings.CART_PURGE_PAUSE,
+                            help='Пауза между пачками в секундах')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Остановиться после N пачек')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(deleted):
+            self.stdout.write(f'{time.perf_counter() - started:.1f} с: '
+                              f'удалено {deleted}')
+
+        deleted = shopping.purge_stale(
+            options['days'], options['batch_size'], options['pause'],
+            options['max_batches'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено записей корзин: {deleted} '
+            f'за {time.perf_counter() - started:.1f} с'))
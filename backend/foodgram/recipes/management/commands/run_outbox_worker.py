@@ -0,0 +1,88 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from recipes import deletion, outbox, sync
+
+logger = logging.getLogger('recipes.outbox')
+
+LAG_REPORT_INTERVAL = 30
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает события outbox пачками в пуле потоков: '
+            'ленты подписок, счётчики и другие побочные эффекты записи. '
+            'Заодно очищает старые события, журнал синхронизации '
+            'и удаляет помеченные рецепты и пользователей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int,
+                            default=settings.OUTBOX_WORKER_THREADS)
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float,
+                            default=settings.OUTBOX_POLL_INTERVAL,
+                            help='Пауза в секундах, когда событий нет')
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать готовые события и выйти')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = outbox.process_pending(options['batch_size'])
+            self.stdout.write(f'Обработано событий: {processed}')
+            self._report_lag()
+            return
+        threads = options['threads']
+        if not connection.features.has_select_for_update_skip_locked:
+            # Без SKIP LOCKED потоки взяли бы одни и те же события.
+            threads = 1
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=threads,
+                                thread_name_prefix='outbox') as executor:
+            for _ in range(threads):
+                executor.submit(self._loop, stop, options['batch_size'],
+                                options['interval'])
+            self.stdout.write(f'Обработчик outbox запущен, потоков: '
+                              f'{threads}')
+            try:
+                while not stop.wait(LAG_REPORT_INTERVAL):
+                    self._report_lag()
+                    outbox.purge_processed()
+                    sync.purge()
+                    self._purge_deleted()
+            except KeyboardInterrupt:
+                self.stdout.write('Остановка...')
+            finally:
+                stop.set()
+                close_old_connections()
+
+    def _loop(self, stop, batch_size, interval):
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                processed = outbox.process_batch(batch_size)
+            except Exception:
+                logger.exception('Ошибка выборки событий outbox')
+                processed = 0
+            if not processed:
+                stop.wait(interval)
+        close_old_connections()
+
+    def _purge_deleted(self):
+        try:
+            stats = deletion.purge(
+                max_batches=settings.PURGE_BATCHES_PER_RUN)
+        except Exception:
+            logger.exception('Ошибка очистки удалённых данных')
+            return
+        if stats:
+            logger.info('Удалено: %s', dict(stats))
+
+    def _report_lag(self):
+        stats = outbox.lag()
+        logger.info('outbox: в очереди %(pending)s, задержка '
+                    '%(lag_seconds).1f с, исчерпали попытки %(failed)s',
+                    stats)
@@ -0,0 +1,171 @@
+import csv
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes import feed, handlers
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag, TagRecipe, Version,
+                            make_content_hash, user_version)
+from users.models import Subscription, User
+
+DEFAULT_CSV = settings.BASE_DIR.parent.parent / 'data' / 'ingredients.csv'
+DEFAULT_TAGS = (('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+                ('Ужин', '#8775D2', 'dinner'))
+WORDS = ('суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'омлет',
+         'паста', 'котлеты', 'жаркое', 'овощи', 'курица', 'говядина',
+         'рыба', 'грибы', 'картофель', 'сыр', 'томаты', 'рис', 'гречка')
+
+
+class Command(BaseCommand):
+    """Генерирует синтетические данные для нагрузочных замеров."""
+
+    help = 'Заполняет БД синтетическими данными для бенчмарков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--csv', default=str(DEFAULT_CSV),
+                            help='Каталог ингредиентов (название,единица)')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        start = time.perf_counter()
+        with transaction.atomic():
+            ingredient_ids = self._load_ingredients(options['csv'])
+            tag_ids = self._create_tags()
+            user_ids = self._create_users(options['users'])
+            recipe_ids = self._create_recipes(options['recipes'], user_ids)
+            self._link_recipes(recipe_ids, ingredient_ids, tag_ids,
+                               options['ingredients_per_recipe'],
+                               options['tags_per_recipe'])
+            self._create_pairs(Favorite, 'recipe_id', user_ids, recipe_ids,
+                               options['favorites'])
+            self._create_pairs(ShoppingCart, 'recipe_id', user_ids,
+                               recipe_ids, options['cart'])
+            self._create_pairs(Subscription, 'author_id', user_ids,
+                               user_ids, options['subscriptions'])
+            self._fill_timelines(user_ids)
+            self._update_counters(user_ids, recipe_ids)
+            Version.objects.bump('tags', 'ingredients', 'recipes', 'users',
+                                 *map(user_version, user_ids))
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - start:.1f} с'))
+
+    def _bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size,
+                                  ignore_conflicts=True)
+        self.stdout.write(f'{model.__name__}: +{len(objects)}')
+
+    def _load_ingredients(self, path):
+        if not Ingredient.objects.exists():
+            try:
+                with open(path, encoding='utf-8') as file:
+                    rows = [row for row in csv.reader(file) if row]
+            except OSError as error:
+                raise CommandError(f'Не удалось прочитать {path}: {error}')
+            self._bulk_create(Ingredient, [
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in rows])
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def _create_tags(self):
+        if not Tag.objects.exists():
+            self._bulk_create(Tag, [Tag(name=name, color=color, slug=slug)
+                                    for name, color, slug in DEFAULT_TAGS])
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def _create_users(self, count):
+        last_id = User.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        password = make_password('benchmark')
+        prefix = f'bench{last_id}_'
+        self._bulk_create(User, [
+            User(username=f'{prefix}{number}',
+                 email=f'{prefix}{number}@example.com',
+                 first_name='Бенч', last_name=str(number),
+                 password=password)
+            for number in range(count)])
+        return list(User.objects.filter(
+            username__startswith=prefix).values_list('id', flat=True))
+
+    def _create_recipes(self, count, user_ids):
+        last_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0
+        choice = self.random.choice
+        recipes = []
+        for number in range(count):
+            name = ' '.join(self.random.sample(WORDS, 3)).capitalize()
+            text = ' '.join(choice(WORDS) for _ in range(60))
+            name = f'{name} №{last_id + number + 1}'
+            recipes.append(Recipe(
+                author_id=choice(user_ids),
+                name=name,
+                text=text,
+                content_hash=make_content_hash(name, text),
+                cooking_time=self.random.randint(5, 180)))
+        self._bulk_create(Recipe, recipes)
+        new_recipes = Recipe.objects.filter(id__gt=last_id)
+        new_recipes.refresh_search_index()
+        return list(new_recipes.values_list('id', flat=True))
+
+    def _link_recipes(self, recipe_ids, ingredient_ids, tag_ids,
+                      ingredients_per_recipe, tags_per_recipe):
+        ingredients = []
+        tags = []
+        for recipe_id in recipe_ids:
+            for ingredient_id in self.random.sample(
+                    ingredient_ids,
+                    min(ingredients_per_recipe, len(ingredient_ids))):
+                ingredients.append(IngredientRecipe(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500)))
+            for tag_id in self.random.sample(
+                    tag_ids, min(tags_per_recipe, len(tag_ids))):
+                tags.append(TagRecipe(recipe_id=recipe_id, tag_id=tag_id))
+        self._bulk_create(IngredientRecipe, ingredients)
+        self._bulk_create(TagRecipe, tags)
+
+    def _create_pairs(self, model, target_field, user_ids, target_ids,
+                      per_user):
+        objects = []
+        for user_id in user_ids:
+            candidates = self.random.sample(
+                target_ids, min(per_user + 1, len(target_ids)))
+            if model is Subscription:
+                candidates = [author_id for author_id in candidates
+                              if author_id != user_id]
+            candidates = candidates[:per_user]
+            objects.extend(model(user_id=user_id, **{target_field: target_id})
+                           for target_id in candidates)
+        self._bulk_create(model, objects)
+
+    def _fill_timelines(self, user_ids):
+        subscriptions = Subscription.objects.filter(
+            user_id__in=user_ids).values_list('user_id', 'author_id')
+        for user_id, author_id in subscriptions.iterator():
+            feed.backfill(user_id, author_id)
+        self.stdout.write('TimelineEntry: заполнены ленты подписок')
+
+    def _update_counters(self, user_ids, recipe_ids):
+        for start in range(0, len(user_ids), self.batch_size):
+            handlers.update_recipes_count(
+                user_ids[start:start + self.batch_size])
+        for start in range(0, len(recipe_ids), self.batch_size):
+            handlers.update_favorites_count(
+                recipe_ids[start:start + self.batch_size])
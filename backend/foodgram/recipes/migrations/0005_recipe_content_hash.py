@@ -0,0 +1,65 @@
+import hashlib
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def make_content_hash(name, text):
+    normalized = '\n'.join(' '.join(value.split()).casefold()
+                           for value in (name, text))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def fill_content_hash(apps, schema_editor):
+    """Заполняет хэш пачками по BATCH_SIZE рецептов.
+    Рецепты, совпавшие после нормализации с уже обработанными,
+    получают хэш с id, чтобы уникальный индекс можно было создать."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    seen = set()
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(Recipe.objects.filter(id__gt=last_id).order_by(
+                'id').only('id', 'name', 'text')[:BATCH_SIZE])
+            if not batch:
+                break
+            for recipe in batch:
+                content_hash = make_content_hash(recipe.name, recipe.text)
+                if content_hash in seen:
+                    content_hash = hashlib.sha256(
+                        f'{content_hash}:{recipe.id}'.encode()).hexdigest()
+                seen.add(content_hash)
+                recipe.content_hash = content_hash
+            Recipe.objects.bulk_update(batch, ['content_hash'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0004_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True,
+                                   verbose_name='Хэш названия и описания'),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='recipe',
+            name='unique_name_text',
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64,
+                                   unique=True,
+                                   verbose_name='Хэш названия и описания'),
+        ),
+    ]
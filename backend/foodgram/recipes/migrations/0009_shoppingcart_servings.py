@@ -0,0 +1,20 @@
+# Generated by Django 3.2.20 on 2026-10-19 10:13
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='servings',
+            field=models.DecimalField(decimal_places=2, default=1, help_text='Во сколько раз изменить количество ингредиентов', max_digits=5, validators=[django.core.validators.MinValueValidator(Decimal('0.1')), django.core.validators.MaxValueValidator(100)], verbose_name='Множитель порций'),
+        ),
+    ]
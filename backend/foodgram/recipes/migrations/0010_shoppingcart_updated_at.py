@@ -0,0 +1,25 @@
+# Generated by Django 3.2.20 on 2026-10-19 10:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_shoppingcart_servings'),
+    ]
+
+    operations = [
+        # Существующим записям срок хранения отсчитывается от миграции.
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['updated_at'], name='cart_updated_idx'),
+        ),
+    ]
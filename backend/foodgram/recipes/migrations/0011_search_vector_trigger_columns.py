@@ -0,0 +1,36 @@
+from django.db import migrations
+
+FORWARD = """
+DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger ON recipes_recipe;
+CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update();
+"""
+
+BACKWARD = """
+DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger ON recipes_recipe;
+CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update();
+"""
+
+
+def _execute(sql):
+    # Счётчики (favorites_count) и пометка удаления обновляют рецепт
+    # часто: search_vector пересчитывается, только если в UPDATE
+    # есть name или text.
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_shoppingcart_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(_execute(FORWARD), _execute(BACKWARD)),
+    ]
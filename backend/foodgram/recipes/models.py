@@ -1,7 +1,33 @@
-from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+import hashlib
+import re
+from decimal import Decimal
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
+from django.core.validators import (MaxValueValidator, MinValueValidator,
+                                    RegexValidator)
+from django.db import connections, models
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+from django.dispatch import Signal
+from django.utils import timezone
 from users.models import User
 
+SEARCH_CONFIG = 'russian'
+SEARCH_FTS_TABLE = 'recipes_recipe_fts'
+
+SERVINGS_MAX = 100
+
+# Отправляется после Version.objects.bump с аргументом names.
+versions_bumped = Signal()
+
+
+def make_content_hash(name, text):
+    """SHA-256 от названия и описания без учёта регистра и пробелов."""
+    normalized = '\n'.join(' '.join(value.split()).casefold()
+                           for value in (name, text))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
 
 class Tag(models.Model):
     """Модель для тегов."""
@@ -50,6 +76,53 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Запросы к рецептам."""
+
+    def search(self, query):
+        """Полнотекстовый поиск по названию и описанию.
+        Результаты аннотируются полем rank и сортируются по нему.
+        В PostgreSQL используется tsvector-колонка search_vector,
+        в SQLite - таблица FTS5 (для локального запуска и тестов)."""
+        if connections[self.db].vendor == 'postgresql':
+            search_query = SearchQuery(query, config=SEARCH_CONFIG,
+                                       search_type='websearch')
+            return self.filter(search_vector=search_query).annotate(
+                rank=SearchRank(F('search_vector'), search_query)
+            ).order_by('-rank', '-id')
+        words = re.findall(r'\w+', query)
+        if not words:
+            return self.none()
+        match = ' '.join(f'"{word}"' for word in words)
+        return self.annotate(rank=RawSQL(
+            f'SELECT -bm25({SEARCH_FTS_TABLE}, 10.0, 1.0) '
+            f'FROM {SEARCH_FTS_TABLE} '
+            f'WHERE {SEARCH_FTS_TABLE} MATCH %s '
+            f'AND {SEARCH_FTS_TABLE}.rowid = recipes_recipe.id',
+            (match,))
+        ).filter(rank__isnull=False).order_by('-rank', '-id')
+
+    def refresh_search_index(self):
+        """Переиндексирует рецепты после массовой вставки.
+        Нужен только для SQLite: в PostgreSQL это делает триггер."""
+        connection = connections[self.db]
+        if connection.vendor != 'sqlite':
+            return
+        sql, params = self.values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {SEARCH_FTS_TABLE} '
+                '(rowid, name, text) SELECT id, name, text '
+                f'FROM recipes_recipe WHERE id IN ({sql})', params)
+
+
+class RecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+    """Рецепты без помеченных удалёнными."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
 
@@ -76,21 +149,51 @@ class Recipe(models.Model):
         'Время приготовления (мин)',
         validators=[MinValueValidator(limit_value=1,
                                       message='Время должно быть больше 0!')])
+    # Заполняется триггером БД (см. миграцию 0002), GIN-индекс там же.
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField('Дата изменения',
+                                      auto_now=True,
+                                      db_index=True)
+    content_hash = models.CharField('Хэш названия и описания',
+                                    max_length=64,
+                                    unique=True,
+                                    editable=False)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        editable=False,
+        help_text='Обновляется обработчиком outbox')
+    deleted_at = models.DateTimeField(
+        'Дата удаления',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text='Строку и связанные данные удалит purge_deleted')
+
+    objects = RecipeManager()
+    all_objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        constraints = [
-            models.UniqueConstraint(
-                fields=['name', 'text'],
-                name='unique_name_text'
-            )
-        ]
         ordering = ['-id']
+        indexes = [
+            models.Index(fields=['deleted_at'],
+                         name='recipe_deleted_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+        ]
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.content_hash = make_content_hash(self.name, self.text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and (
+                {'name', 'text'} & set(update_fields)):
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        super().save(*args, **kwargs)
+
 
 class TagRecipe(models.Model):
     """Связующая модель для рецептов и тегов."""
@@ -171,6 +274,17 @@ class ShoppingCart(models.Model):
                                verbose_name='Рецепт для приготовления',
                                on_delete=models.CASCADE,
                                help_text='Выберите рецепт для приготовления')
+    servings = models.DecimalField(
+        'Множитель порций',
+        max_digits=5,
+        decimal_places=2,
+        default=1,
+        validators=[MinValueValidator(Decimal('0.1')),
+                    MaxValueValidator(SERVINGS_MAX)],
+        help_text='Во сколько раз изменить количество ингредиентов')
+    # Записи без изменений дольше CART_RETENTION_DAYS удаляет
+    # purge_stale_carts.
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -178,6 +292,149 @@ class ShoppingCart(models.Model):
         constraints = [models.UniqueConstraint(
             fields=['user', 'recipe'],
             name='unique_shopping_cart')]
+        indexes = [models.Index(fields=['updated_at'],
+                                name='cart_updated_idx')]
 
     def __str__(self):
         return f'{self.recipe}'
+
+
+class TimelineEntry(models.Model):
+    """Лента пользователя: рецепты авторов, на которых он подписан.
+    Заполняется при публикации рецепта (fan-out-on-write)."""
+
+    user = models.ForeignKey(User,
+                             related_name='timeline',
+                             on_delete=models.CASCADE,
+                             verbose_name='Пользователь')
+    recipe = models.ForeignKey(Recipe,
+                               related_name='timeline_entries',
+                               on_delete=models.CASCADE,
+                               verbose_name='Рецепт')
+    author = models.ForeignKey(User,
+                               related_name='+',
+                               on_delete=models.CASCADE,
+                               verbose_name='Автор')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_user_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента'
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
+
+
+class OutboxEvent(models.Model):
+    """Событие о записи, сохранённое в той же транзакции.
+    Обрабатывается командой run_outbox_worker."""
+
+    topic = models.CharField('Тип события', max_length=64)
+    payload = models.JSONField('Данные', default=dict)
+    idempotency_key = models.CharField('Ключ идемпотентности',
+                                       max_length=128,
+                                       unique=True)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    available_at = models.DateTimeField('Доступно для обработки',
+                                        default=timezone.now)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    processed_at = models.DateTimeField('Дата обработки',
+                                        null=True,
+                                        blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at'],
+                         name='outbox_pending_idx',
+                         condition=models.Q(processed_at__isnull=True)),
+        ]
+        ordering = ['id']
+        verbose_name = 'Событие outbox'
+        verbose_name_plural = 'События outbox'
+
+    def __str__(self):
+        return f'{self.topic} {self.idempotency_key}'
+
+
+class ChangeLog(models.Model):
+    """Журнал изменений данных пользователя для /api/sync/.
+    Удаление записывается как tombstone с action=delete.
+    Записи удалённых пользователей не удаляются каскадом
+    (при каскаде сигналы пишут новые), их убирает очистка журнала."""
+
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTIONS = ((UPSERT, 'Создание или изменение'), (DELETE, 'Удаление'))
+
+    seq = models.BigAutoField('Номер изменения', primary_key=True)
+    user = models.ForeignKey(User,
+                             on_delete=models.DO_NOTHING,
+                             db_constraint=False,
+                             related_name='+',
+                             verbose_name='Пользователь')
+    entity = models.CharField('Тип объекта', max_length=32)
+    object_id = models.BigIntegerField('id объекта')
+    action = models.CharField('Действие', max_length=6, choices=ACTIONS)
+    created_at = models.DateTimeField('Дата изменения', default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'seq'],
+                         name='changelog_user_seq_idx'),
+        ]
+        verbose_name = 'Изменение'
+        verbose_name_plural = 'Журнал изменений'
+
+    def __str__(self):
+        return f'{self.seq} {self.entity}:{self.object_id} {self.action}'
+
+
+class VersionQuerySet(models.QuerySet):
+    """Счётчики версий данных для проверки актуальности кэша."""
+
+    def bump(self, *names):
+        for name in names:
+            updated = self.filter(name=name).update(
+                version=F('version') + 1, updated_at=timezone.now())
+            if not updated:
+                self.get_or_create(name=name, defaults={'version': 1})
+        versions_bumped.send(sender=self.model, names=names)
+
+    def stamps(self, names):
+        return {version.name: version
+                for version in self.filter(name__in=names)}
+
+
+class Version(models.Model):
+    """Версия набора данных: увеличивается при каждом изменении.
+    Имена: tags, ingredients, recipes, users и user:<id> для
+    избранного, корзины и подписок конкретного пользователя."""
+
+    name = models.CharField('Набор данных',
+                            max_length=64,
+                            primary_key=True)
+    version = models.PositiveBigIntegerField('Версия', default=0)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+
+    objects = VersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+
+def user_version(user_id):
+    return f'user:{user_id}'
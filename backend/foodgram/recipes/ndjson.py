@@ -0,0 +1,230 @@
+"""Потоковый экспорт и импорт рецептов в формате NDJSON.
+
+Одна строка - один рецепт с тегами, ингредиентами, автором
+и путём к картинке. Данные читаются и пишутся пачками,
+поэтому расход памяти не зависит от размера выгрузки."""
+
+import json
+import posixpath
+import time
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from users.models import User
+
+from . import outbox, sync
+from .models import (Ingredient, IngredientRecipe, Recipe, Tag, TagRecipe,
+                     Version, make_content_hash)
+
+CHUNK_SIZE = 500
+RECIPE_FIELDS = ('name', 'text', 'cooking_time', 'image', 'content_hash')
+RECIPE_EXCLUDE = tuple(
+    field.name for field in Recipe._meta.concrete_fields
+    if field.name not in RECIPE_FIELDS)
+
+
+def _validate_image(name):
+    """Путь к картинке - относительный путь внутри хранилища."""
+    if not name:
+        return
+    max_length = Recipe._meta.get_field('image').max_length
+    if (len(name) > max_length or '\\' in name or '\x00' in name
+            or posixpath.isabs(name)
+            or '..' in name.split('/')
+            or posixpath.normpath(name) != name):
+        raise ValidationError(f'Недопустимый путь к картинке: {name!r}')
+
+
+def export_lines(queryset=None, chunk_size=CHUNK_SIZE):
+    """Генератор строк NDJSON. Рецепты выбираются пачками по id:
+    в Django 3.2 iterator() не работает вместе с prefetch_related."""
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    queryset = queryset.order_by('id').select_related('author').only(
+        'id', 'name', 'text', 'cooking_time', 'image', 'author__email'
+    ).prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.only('id', 'slug')),
+        Prefetch('ingredient_recipe',
+                 queryset=IngredientRecipe.objects.select_related(
+                     'ingredient')))
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        for recipe in chunk:
+            yield json.dumps({
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'image': recipe.image.name or None,
+                'author': recipe.author.email,
+                'tags': [tag.slug for tag in recipe.tags.all()],
+                'ingredients': [
+                    {'name': item.ingredient.name,
+                     'measurement_unit': item.ingredient.measurement_unit,
+                     'amount': item.amount}
+                    for item in recipe.ingredient_recipe.all()],
+            }, ensure_ascii=False) + '\n'
+        last_id = chunk[-1].id
+
+
+class Importer:
+    """Импорт рецептов пачками через bulk_create.
+    Ингредиенты и теги сопоставляются по заранее загруженным словарям,
+    отсутствующие ингредиенты создаются. Рецепты, которые уже есть
+    (по content_hash), пропускаются."""
+
+    def __init__(self, batch_size=CHUNK_SIZE, default_author=None):
+        self.batch_size = batch_size
+        self.default_author = default_author
+        self.ingredients = dict(
+            Ingredient.objects.values_list('name', 'id'))
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.stats = {'read': 0, 'created': 0, 'duplicates': 0,
+                      'errors': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+        self.errors = []
+
+    def run(self, lines):
+        start = time.perf_counter()
+        batch = []
+        for line_number, line in enumerate(lines, start=1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            self.stats['read'] += 1
+            try:
+                record = self._parse(json.loads(line))
+            except ValidationError as error:
+                self._error(line_number, 'Некорректная запись: '
+                                         + '; '.join(error.messages))
+                continue
+            except (ValueError, TypeError, KeyError,
+                    AttributeError) as error:
+                self._error(line_number, f'Некорректная запись: {error!r}')
+                continue
+            record['line'] = line_number
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch)
+                batch = []
+        if batch:
+            self._import_batch(batch)
+        if self.stats['created']:
+            Version.objects.bump('recipes', 'ingredients')
+        seconds = time.perf_counter() - start
+        self.stats['seconds'] = round(seconds, 3)
+        self.stats['rows_per_second'] = round(
+            self.stats['read'] / seconds, 1) if seconds else 0.0
+        return self.stats
+
+    def _error(self, line_number, message):
+        self.stats['errors'] += 1
+        if len(self.errors) < 100:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def _parse(self, record):
+        name = str(record['name'])
+        text = str(record['text'])
+        cooking_time = record.get('cooking_time')
+        record = {
+            'name': name,
+            'text': text,
+            'content_hash': make_content_hash(name, text),
+            'cooking_time': 1 if cooking_time is None else int(cooking_time),
+            'image': str(record.get('image') or ''),
+            'author': record.get('author'),
+            'tags': [str(slug) for slug in record.get('tags') or ()],
+            'ingredients': [
+                {'name': str(item['name']),
+                 'measurement_unit': str(item.get('measurement_unit', '')),
+                 'amount': int(item['amount'])}
+                for item in record.get('ingredients') or ()],
+        }
+        self._validate(record)
+        return record
+
+    def _validate(self, record):
+        """Проверки полей моделей до bulk_create: иначе одна
+        ошибочная строка прервала бы транзакцию всей пачки."""
+        _validate_image(record['image'])
+        Recipe(**{field: record[field] for field in RECIPE_FIELDS}
+               ).clean_fields(exclude=RECIPE_EXCLUDE)
+        for item in record['ingredients']:
+            IngredientRecipe(amount=item['amount']).clean_fields(
+                exclude=('recipe', 'ingredient'))
+            if item['name'] not in self.ingredients:
+                Ingredient(name=item['name'],
+                           measurement_unit=item['measurement_unit']
+                           ).clean_fields()
+
+    def _ingredient_id(self, item):
+        ingredient_id = self.ingredients.get(item['name'])
+        if ingredient_id is None:
+            ingredient_id = Ingredient.objects.get_or_create(
+                name=item['name'],
+                defaults={'measurement_unit': item['measurement_unit']}
+            )[0].id
+            self.ingredients[item['name']] = ingredient_id
+        return ingredient_id
+
+    @transaction.atomic
+    def _import_batch(self, batch):
+        authors = dict(User.objects.filter(
+            email__in={record['author'] for record in batch}
+        ).values_list('email', 'id'))
+        hashes = {}
+        for record in batch:
+            hashes.setdefault(record['content_hash'], record)
+        self.stats['duplicates'] += len(batch) - len(hashes)
+        existing = set(Recipe.objects.filter(
+            content_hash__in=hashes).values_list('content_hash', flat=True))
+        self.stats['duplicates'] += len(existing)
+        recipes = []
+        for content_hash, record in hashes.items():
+            if content_hash in existing:
+                continue
+            author_id = authors.get(record['author'], self.default_author)
+            if author_id is None:
+                self._error(record['line'],
+                            f'Автор {record["author"]} не найден')
+                continue
+            recipes.append(Recipe(
+                author_id=author_id, name=record['name'],
+                text=record['text'], image=record['image'],
+                cooking_time=record['cooking_time'],
+                content_hash=content_hash))
+        if not recipes:
+            return
+        Recipe.objects.bulk_create(recipes)
+        # В SQLite bulk_create не возвращает id, поэтому ищем по хэшу.
+        ids = dict(Recipe.objects.filter(
+            content_hash__in=[recipe.content_hash for recipe in recipes]
+        ).values_list('content_hash', 'id'))
+        ingredients = []
+        tags = []
+        for recipe in recipes:
+            record = hashes[recipe.content_hash]
+            recipe_id = ids[recipe.content_hash]
+            ingredients.extend(
+                IngredientRecipe(recipe_id=recipe_id,
+                                 ingredient_id=self._ingredient_id(item),
+                                 amount=item['amount'])
+                for item in record['ingredients'])
+            tags.extend(TagRecipe(recipe_id=recipe_id, tag_id=self.tags[slug])
+                        for slug in record['tags'] if slug in self.tags)
+        IngredientRecipe.objects.bulk_create(ingredients,
+                                             ignore_conflicts=True)
+        TagRecipe.objects.bulk_create(tags)
+        Recipe.objects.filter(id__in=ids.values()).refresh_search_index()
+        sync.record_many(sync.RECIPE, [
+            (recipe.author_id, ids[recipe.content_hash])
+            for recipe in recipes])
+        outbox.publish_many('recipe.created', [
+            (ids[recipe.content_hash],
+             {'recipe_id': ids[recipe.content_hash],
+              'author_id': recipe.author_id})
+            for recipe in recipes])
+        self.stats['created'] += len(recipes)
@@ -0,0 +1,140 @@
+"""Transactional outbox для побочных эффектов записи.
+
+Событие OutboxEvent пишется в той же транзакции, что и данные,
+поэтому оно появляется только после коммита и не теряется при
+падении процесса. Команда run_outbox_worker забирает события
+пачками и передаёт их обработчикам, подписанным на тип события."""
+
+import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+_handlers = defaultdict(list)
+
+
+def handler(*topics):
+    """Регистрирует обработчик событий указанных типов.
+    Обработчик получает список payload всей пачки и должен быть
+    идемпотентным: после ошибки пачка обрабатывается повторно."""
+    def decorator(func):
+        for topic in topics:
+            _handlers[topic].append(func)
+        return func
+    return decorator
+
+
+def publish(topic, payload, key=None):
+    """Записывает событие в текущей транзакции.
+    Событие с уже существующим ключом повторно не создаётся, поэтому
+    ключ строится по изменённой строке и действию (f'{id}:deleted').
+    Без ключа событие уникально и от повторной публикации не защищено."""
+    publish_many(topic, [(key, payload)])
+
+
+def publish_many(topic, events):
+    """Записывает пачку событий (ключ, payload) одним запросом."""
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(topic=topic, payload=payload,
+                     idempotency_key=f'{topic}:{key or uuid.uuid4().hex}')
+         for key, payload in events],
+        ignore_conflicts=True)
+    if settings.OUTBOX_EAGER:
+        transaction.on_commit(process_pending)
+
+
+def _pending():
+    return OutboxEvent.objects.filter(
+        processed_at__isnull=True,
+        attempts__lt=settings.OUTBOX_MAX_ATTEMPTS)
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=min(
+        settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.OUTBOX_MAX_RETRY_DELAY))
+
+
+def process_batch(batch_size=None):
+    """Обрабатывает одну пачку событий и возвращает её размер.
+    Строки блокируются с SKIP LOCKED, поэтому несколько потоков
+    и процессов не берут одни и те же события. Результат обработчиков
+    и отметка о выполнении фиксируются одной транзакцией."""
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        events = list(_pending().filter(
+            available_at__lte=timezone.now()
+        ).select_for_update(skip_locked=True)[:batch_size])
+        if not events:
+            return 0
+        by_topic = defaultdict(list)
+        for event in events:
+            by_topic[event.topic].append(event)
+        now = timezone.now()
+        for topic, group in by_topic.items():
+            try:
+                with transaction.atomic():
+                    for func in _handlers.get(topic, ()):
+                        func([event.payload for event in group])
+            except Exception as error:
+                logger.exception('Ошибка обработки событий %s', topic)
+                for event in group:
+                    event.attempts += 1
+                    event.last_error = repr(error)
+                    event.available_at = now + _retry_delay(event.attempts)
+            else:
+                for event in group:
+                    event.processed_at = now
+        OutboxEvent.objects.bulk_update(
+            events,
+            ['attempts', 'last_error', 'available_at', 'processed_at'])
+    return len(events)
+
+
+def process_pending(batch_size=None):
+    """Обрабатывает все готовые события, возвращает их число."""
+    total = 0
+    while True:
+        processed = process_batch(batch_size)
+        if not processed:
+            return total
+        total += processed
+
+
+def lag():
+    """Очередь outbox: число необработанных событий, возраст самого
+    старого из них в секундах и число событий, исчерпавших попытки."""
+    stats = _pending().aggregate(pending=Count('id'),
+                                 oldest=Min('created_at'))
+    oldest = stats['oldest']
+    return {
+        'pending': stats['pending'],
+        'lag_seconds': ((timezone.now() - oldest).total_seconds()
+                        if oldest else 0.0),
+        'failed': OutboxEvent.objects.filter(
+            processed_at__isnull=True,
+            attempts__gte=settings.OUTBOX_MAX_ATTEMPTS).count(),
+    }
+
+
+def purge_processed(batch_size=1000):
+    """Удаляет пачками события старше OUTBOX_RETENTION_HOURS."""
+    cutoff = timezone.now() - timedelta(
+        hours=settings.OUTBOX_RETENTION_HOURS)
+    deleted = 0
+    while True:
+        ids = list(OutboxEvent.objects.filter(
+            processed_at__lt=cutoff).values_list('id', flat=True)[
+                :batch_size])
+        if not ids:
+            return deleted
+        deleted += OutboxEvent.objects.filter(id__in=ids).delete()[0]
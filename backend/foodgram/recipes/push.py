@@ -0,0 +1,162 @@
+"""Рассылка изменений подключённым по SSE клиентам.
+
+sync.record публикует событие в канал foodgram_sync. В PostgreSQL
+это NOTIFY в транзакции изменения, поэтому событие уходит только
+после коммита и доходит до всех ASGI-процессов. В каждом процессе
+Hub раскладывает события по очередям подключений пользователя.
+В SQLite и тестах события доставляются в пределах процесса."""
+
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'foodgram_sync'
+
+
+def _use_postgres(using='default'):
+    return (settings.PUSH_BACKEND == 'postgres'
+            and connections[using].vendor == 'postgresql')
+
+
+def publish(event, using='default'):
+    """event: {'user': id, 'seq': номер в журнале, ...}."""
+    if _use_postgres(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           [CHANNEL, json.dumps(event)])
+    else:
+        transaction.on_commit(lambda: hub.dispatch(event), using=using)
+
+
+class Listener:
+    """Очередь событий одного подключения. Очередь ограничена
+    SSE_BUFFER_SIZE: при переполнении новые события отбрасываются,
+    а подключение догоняет пропущенное по журналу."""
+
+    def __init__(self, user_id, loop, size):
+        self.user_id = user_id
+        self.loop = loop
+        self.size = size
+        self.events = deque()
+        self.overflowed = False
+        self.ready = asyncio.Event()
+
+    def put(self, event):
+        """Вызывается в цикле событий подключения."""
+        if len(self.events) >= self.size:
+            self.overflowed = True
+        else:
+            self.events.append(event)
+        self.ready.set()
+
+    def lost(self):
+        """События могли потеряться: подключение сверится с журналом."""
+        self.overflowed = True
+        self.ready.set()
+
+    def take(self):
+        self.ready.clear()
+        events, overflowed = list(self.events), self.overflowed
+        self.events.clear()
+        self.overflowed = False
+        return events, overflowed
+
+
+class Hub:
+    """Подписки подключений процесса по пользователям."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners = defaultdict(set)
+        self._listening_pid = None
+
+    def subscribe(self, user_id):
+        self._ensure_listening()
+        listener = Listener(user_id, asyncio.get_running_loop(),
+                            settings.SSE_BUFFER_SIZE)
+        with self._lock:
+            self._listeners[user_id].add(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            listeners = self._listeners.get(listener.user_id)
+            if listeners is not None:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[listener.user_id]
+
+    def dispatch(self, event):
+        """Можно вызывать из любого потока."""
+        with self._lock:
+            listeners = list(self._listeners.get(event['user'], ()))
+        for listener in listeners:
+            listener.loop.call_soon_threadsafe(listener.put, event)
+
+    def lost(self):
+        with self._lock:
+            listeners = [listener for listeners in self._listeners.values()
+                         for listener in listeners]
+        for listener in listeners:
+            listener.loop.call_soon_threadsafe(listener.lost)
+
+    def _ensure_listening(self):
+        """Поток LISTEN запускается при первом подключении
+        в процессе: WSGI-воркерам он не нужен."""
+        if self._listening_pid == os.getpid() or not _use_postgres():
+            return
+        with self._lock:
+            if self._listening_pid == os.getpid():
+                return
+            threading.Thread(target=self._listen, daemon=True,
+                             name='push-listener').start()
+            self._listening_pid = os.getpid()
+
+    def _connect(self):
+        connection = connections['default']
+        raw = connection.get_new_connection(
+            connection.get_connection_params())
+        raw.autocommit = True
+        with raw.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return raw
+
+    def _listen(self):
+        interval = settings.SSE_HEARTBEAT_SECONDS
+        raw = None
+        reconnect = False
+        while True:
+            try:
+                if raw is None:
+                    raw = self._connect()
+                    if reconnect:
+                        # Пока соединения не было, события могли
+                        # потеряться.
+                        self.lost()
+                    reconnect = True
+                if select.select([raw], [], [], interval) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    self.dispatch(json.loads(raw.notifies.pop(0).payload))
+            except Exception:
+                logger.exception('Канал событий SSE отключился')
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+                raw = None
+                threading.Event().wait(interval)
+
+
+hub = Hub()
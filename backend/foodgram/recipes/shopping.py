@@ -0,0 +1,122 @@
+"""Список покупок с учётом множителя порций.
+
+Количество ингредиентов суммируется в БД одним запросом
+с группировкой по названию и единице измерения:
+Sum(amount * множитель). Строки IngredientRecipe в Python
+не загружаются.
+
+Записи корзины, которые не менялись CART_RETENTION_DAYS дней,
+удаляет purge_stale пачками."""
+
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+
+from . import sync
+from .models import (ChangeLog, IngredientRecipe, ShoppingCart, Version,
+                     user_version)
+
+MULTIPLIER_FIELD = DecimalField(max_digits=5, decimal_places=2)
+AMOUNT_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _totals(queryset, multiplier):
+    rows = queryset.filter(recipe__deleted_at__isnull=True).values(
+        'ingredient__name', 'ingredient__measurement_unit').annotate(
+            total=Sum(F('amount') * multiplier,
+                      output_field=AMOUNT_FIELD)).order_by(
+                          'ingredient__name', 'ingredient__measurement_unit')
+    return [{'name': row['ingredient__name'],
+             'measurement_unit': row['ingredient__measurement_unit'],
+             'amount': _number(row['total'])} for row in rows]
+
+
+def _number(value):
+    """150.00 -> 150, 37.5 -> 37.5."""
+    value = Decimal(value).quantize(Decimal('0.01'))
+    return int(value) if value == value.to_integral() else float(value)
+
+
+def cart_plan(user):
+    """Список покупок корзины пользователя: у каждого рецепта
+    свой множитель servings."""
+    return _totals(
+        IngredientRecipe.objects.filter(recipe__shopping_cart__user=user),
+        F('recipe__shopping_cart__servings'))
+
+
+def recipes_plan(servings):
+    """Список покупок для произвольных рецептов:
+    servings - {id рецепта: множитель}."""
+    multiplier = Case(
+        *(When(recipe_id=recipe_id, then=Value(value))
+          for recipe_id, value in servings.items()),
+        output_field=MULTIPLIER_FIELD)
+    return _totals(
+        IngredientRecipe.objects.filter(recipe_id__in=list(servings)),
+        multiplier)
+
+
+def as_text(plan):
+    lines = ['Список покупок:\n']
+    for item in plan:
+        lines.append(f'\n{item["name"]} - {item["amount"]}, '
+                     f'{item["measurement_unit"]}')
+    return ''.join(lines)
+
+
+def _purge_batch(cutoff, batch_size):
+    """Удаляет одну пачку устаревших записей в своей транзакции.
+    Строки, которые сейчас меняет другой запрос, пропускаются."""
+    with transaction.atomic():
+        rows = list(ShoppingCart.objects.filter(
+            updated_at__lt=cutoff).order_by('updated_at').select_for_update(
+                skip_locked=True).values_list(
+                    'id', 'user_id', 'recipe_id')[:batch_size])
+        if not rows:
+            return 0
+        ids = [row_id for row_id, _, _ in rows]
+        placeholders = ', '.join(['%s'] * len(ids))
+        # Без сборщика и сигналов на каждую строку: журнал
+        # синхронизации и версии пользователей обновляются пачкой.
+        with connections[ShoppingCart.objects.db].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {ShoppingCart._meta.db_table} '
+                           f'WHERE id IN ({placeholders})', ids)
+        sync.record_many(sync.SHOPPING_CART,
+                         [(user_id, recipe_id)
+                          for _, user_id, recipe_id in rows],
+                         ChangeLog.DELETE)
+        Version.objects.bump(*sorted({user_version(user_id)
+                                      for _, user_id, _ in rows}))
+    return len(rows)
+
+
+def purge_stale(days=None, batch_size=None, pause=None, max_batches=None,
+                progress=None):
+    """Удаляет записи корзины старше days дней (CART_RETENTION_DAYS,
+    0 - не удалять). Между пачками выдерживается пауза pause секунд,
+    чтобы autovacuum успевал за удалением, а реплики - за записью.
+    progress(deleted) вызывается после каждой пачки.
+    Возвращает число удалённых строк."""
+    days = settings.CART_RETENTION_DAYS if days is None else days
+    if not days:
+        return 0
+    batch_size = batch_size or settings.CART_PURGE_BATCH_SIZE
+    pause = settings.CART_PURGE_PAUSE if pause is None else pause
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = _purge_batch(cutoff, batch_size)
+        deleted += count
+        batches += 1
+        if progress is not None and count:
+            progress(deleted)
+        if count < batch_size:
+            break
+        time.sleep(pause)
+    return deleted
@@ -0,0 +1,102 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from users.models import Subscription, User
+
+from . import sync
+from .models import (SEARCH_FTS_TABLE, ChangeLog, Favorite, Ingredient, Recipe,
+                     ShoppingCart, Tag, Version, user_version)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_index(sender, instance, using, **kwargs):
+    """Обновляет таблицу FTS5 при сохранении рецепта в SQLite.
+    В PostgreSQL search_vector заполняет триггер."""
+    if connections[using].vendor != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {SEARCH_FTS_TABLE} (rowid, name, text) '
+            'VALUES (%s, %s, %s)',
+            (instance.pk, instance.name, instance.text))
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_search_index(sender, instance, using, **kwargs):
+    """Удаляет рецепт из таблицы FTS5 в SQLite."""
+    if connections[using].vendor != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_FTS_TABLE} WHERE rowid = %s',
+            (instance.pk,))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    Version.objects.bump('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    Version.objects.bump('ingredients')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipes_version(sender, **kwargs):
+    Version.objects.bump('recipes')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_users_version(sender, update_fields=None, **kwargs):
+    """Обновление last_login при входе версию не меняет."""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    Version.objects.bump('users')
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def bump_user_version(sender, instance, **kwargs):
+    """Флаги is_favorited, is_in_shopping_cart и is_subscribed
+    зависят от пользователя, поэтому версия у каждого своя."""
+    Version.objects.bump(user_version(instance.user_id))
+
+
+SYNC_ENTITIES = {
+    Favorite: (sync.FAVORITE, 'user_id', 'recipe_id'),
+    ShoppingCart: (sync.SHOPPING_CART, 'user_id', 'recipe_id'),
+    Subscription: (sync.SUBSCRIPTION, 'user_id', 'author_id'),
+    Recipe: (sync.RECIPE, 'author_id', 'id'),
+}
+
+
+def _record_change(instance, action):
+    entity, user_field, object_field = SYNC_ENTITIES[type(instance)]
+    sync.record(getattr(instance, user_field), entity,
+                getattr(instance, object_field), action)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_save, sender=Recipe)
+def record_upsert(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _record_change(instance, ChangeLog.UPSERT)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_delete, sender=Recipe)
+def record_delete(sender, instance, **kwargs):
+    _record_change(instance, ChangeLog.DELETE)
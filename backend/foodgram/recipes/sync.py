@@ -0,0 +1,150 @@
+"""Журнал изменений для синхронизации клиентов (/api/sync/).
+
+Изменения избранного, корзины, подписок и собственных рецептов
+пользователя пишутся в ChangeLog в той же транзакции, что и сами
+данные. Курсор клиента - номер (seq) последнего полученного изменения.
+
+Номер выдаётся при вставке, а видна запись становится после коммита,
+поэтому изменение с меньшим номером может появиться позже изменения
+с большим. Курсор не продвигается за записи моложе
+SYNC_SETTLE_SECONDS: они отдаются сразу и повторяются в следующем
+ответе. Повтор безопасен - действие описывает итоговое состояние.
+
+Изменения избранного, корзины и подписок также рассылаются
+подключённым по SSE клиентам (push, api.events)."""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import push
+from .models import ChangeLog, Version
+
+FAVORITE = 'favorite'
+SHOPPING_CART = 'shopping_cart'
+SUBSCRIPTION = 'subscription'
+RECIPE = 'recipe'
+
+# Изменения, которые рассылаются по SSE.
+PUSH_ENTITIES = (FAVORITE, SHOPPING_CART, SUBSCRIPTION)
+
+# Наибольший удалённый очисткой seq: более старые курсоры
+# уже не восстановить, клиент загружает данные заново.
+PURGED = 'changelog:purged'
+
+
+def event(row):
+    return {'user': row.user_id, 'seq': row.seq, 'entity': row.entity,
+            'id': row.object_id, 'action': row.action}
+
+
+def record(user_id, entity, object_id, action=ChangeLog.UPSERT):
+    row = ChangeLog.objects.create(user_id=user_id, entity=entity,
+                                   object_id=object_id, action=action)
+    if entity in PUSH_ENTITIES:
+        push.publish(event(row))
+
+
+def record_many(entity, items, action=ChangeLog.UPSERT):
+    """items: [(user_id, object_id)]."""
+    if (entity in PUSH_ENTITIES and not connections[
+            ChangeLog.objects.db].features.can_return_rows_from_bulk_insert):
+        # Для событий SSE нужен seq каждой строки.
+        for user_id, object_id in items:
+            record(user_id, entity, object_id, action)
+        return
+    rows = ChangeLog.objects.bulk_create(
+        ChangeLog(user_id=user_id, entity=entity, object_id=object_id,
+                  action=action)
+        for user_id, object_id in items)
+    if entity in PUSH_ENTITIES:
+        for row in rows:
+            push.publish(event(row))
+
+
+def _purged():
+    return Version.objects.filter(name=PURGED).values_list(
+        'version', flat=True).first() or 0
+
+
+def _settled_before():
+    return timezone.now() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+
+
+def _reset(user, purged):
+    last = ChangeLog.objects.filter(
+        user=user, created_at__lte=_settled_before()
+    ).order_by('-seq').values_list('seq', flat=True).first()
+    return {'cursor': max(last or 0, purged), 'reset': True,
+            'has_more': False, 'changes': []}
+
+
+def changes_since(user, since, limit=None):
+    """Изменения пользователя после курсора since.
+    Несколько изменений одного объекта сворачиваются в последнее.
+    reset=True: курсора нет или он старше очищенной части журнала,
+    клиент должен загрузить данные целиком и продолжить с cursor."""
+    purged = _purged()
+    if since is None or since < purged:
+        return _reset(user, purged)
+    limit = limit or settings.SYNC_PAGE_SIZE
+    rows = list(ChangeLog.objects.filter(
+        user=user, seq__gt=since
+    ).order_by('seq').only(
+        'seq', 'entity', 'object_id', 'action', 'created_at')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    settled_before = _settled_before()
+    cursor = since
+    for row in rows:
+        if row.created_at > settled_before:
+            break
+        cursor = row.seq
+    latest = {}
+    for row in rows:
+        key = (row.entity, row.object_id)
+        latest.pop(key, None)
+        latest[key] = row
+    return {
+        'cursor': cursor,
+        'reset': False,
+        'has_more': has_more and cursor == rows[-1].seq,
+        'changes': [{'entity': row.entity, 'id': row.object_id,
+                     'action': row.action} for row in latest.values()],
+    }
+
+
+def latest_seq(user_id):
+    return ChangeLog.objects.filter(user_id=user_id).order_by(
+        '-seq').values_list('seq', flat=True).first() or _purged()
+
+
+def push_events_after(user_id, last_seq, limit):
+    """События для SSE после last_seq. None, если их больше limit
+    или журнал уже очищен: клиенту нужен /api/sync/."""
+    if last_seq < _purged():
+        return None
+    rows = list(ChangeLog.objects.filter(
+        user_id=user_id, seq__gt=last_seq, entity__in=PUSH_ENTITIES
+    ).order_by('seq')[:limit + 1])
+    if len(rows) > limit:
+        return None
+    return [event(row) for row in rows]
+
+
+def purge(batch_size=1000):
+    """Удаляет пачками записи старше SYNC_RETENTION_DAYS
+    и сдвигает отметку очистки."""
+    cutoff = timezone.now() - timedelta(days=settings.SYNC_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        seqs = list(ChangeLog.objects.filter(
+            created_at__lt=cutoff).order_by('seq').values_list(
+                'seq', flat=True)[:batch_size])
+        if not seqs:
+            return deleted
+        Version.objects.update_or_create(
+            name=PURGED, defaults={'version': seqs[-1]})
+        deleted += ChangeLog.objects.filter(seq__in=seqs).delete()[0]
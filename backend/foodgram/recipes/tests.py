@@ -0,0 +1,62 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+
+class AdminQueryCountTest(TestCase):
+    """Число SQL-запросов страниц админки не зависит от числа строк:
+    list_select_related, raw_id_fields и аннотации не дают N+1."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_benchmark', users=20, recipes=60, favorites=5,
+                     cart=5, subscriptions=3, stdout=StringIO())
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin',
+            password='admin', first_name='Админ', last_name='Админов')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assert_page_queries(self, url, num):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_changelists(self):
+        # Сессия, пользователь, COUNT(*), строки страницы
+        # и фильтр по тегам у рецептов.
+        for model, num in (('recipe', 5), ('favorite', 4),
+                           ('shoppingcart', 4), ('ingredientrecipe', 4)):
+            with self.subTest(model=model):
+                self.assert_page_queries(
+                    reverse(f'admin:recipes_{model}_changelist'), num)
+
+    def test_recipe_change_page(self):
+        """Число запросов не растёт с числом ингредиентов и тегов."""
+        small, large = Recipe.objects.order_by('id')[:2]
+        large.ingredient_recipe.all().delete()
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=large, ingredient=ingredient, amount=1)
+            for ingredient in Ingredient.objects.order_by('id')[:20])
+        large.tags.set(Tag.objects.all())
+        small.ingredient_recipe.exclude(
+            id=small.ingredient_recipe.order_by('id').first().id).delete()
+        small.tags.clear()
+        # Кэш ContentType заполняется первым запросом.
+        self.client.get(reverse('admin:recipes_recipe_change',
+                                args=(small.id,)))
+        for recipe in (small, large):
+            with self.subTest(ingredients=recipe.ingredient_recipe.count()):
+                url = reverse('admin:recipes_recipe_change',
+                              args=(recipe.id,))
+                self.assert_page_queries(url, 8)
+        response = self.client.get(url)
+        ingredient = large.ingredient_recipe.select_related(
+            'ingredient').first().ingredient
+        self.assertContains(
+            response, f'<option value="{ingredient.id}" selected>')
@@ -1,15 +1,34 @@
 from django.contrib import admin
+from recipes.deletion import SoftDeleteAdminMixin, delete_users
+from recipes.paginators import EstimatedCountPaginator
 
 from .models import Subscription, User
 
 
+@admin.register(User)
+class UserAdmin(SoftDeleteAdminMixin, admin.ModelAdmin):
+    """Админ-зона пользователей."""
+
+    soft_delete = staticmethod(delete_users)
+
+    list_display = ('id', 'email', 'username', 'first_name', 'last_name',
+                    'recipes_count')
+    search_fields = ('email', 'username')
+    list_filter = ('is_staff', 'is_active')
+    readonly_fields = ('recipes_count',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 class SubscriptionAdmin(admin.ModelAdmin):
     """ Админ-зона подписок."""
 
     list_display = ('user', 'author')
-    list_filter = ('author',)
-    search_fields = ('user',)
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
+    search_fields = ('user__email', 'author__email')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
-admin.site.register(User)
 admin.site.register(Subscription, SubscriptionAdmin)
@@ -1,7 +1,14 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
 
+class ActiveUserManager(UserManager):
+    """Пользователи без помеченных удалёнными."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class User(AbstractUser):
     """Переопределение базовой модели User."""
 
@@ -17,6 +24,20 @@ class User(AbstractUser):
                                  max_length=150)
     password = models.CharField('Пароль',
                                 max_length=150)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+        help_text='Обновляется обработчиком outbox')
+    deleted_at = models.DateTimeField(
+        'Дата удаления',
+        null=True,
+        blank=True,
+        editable=False,
+        help_text='Строку и связанные данные удалит purge_deleted')
+
+    objects = ActiveUserManager()
+    all_objects = UserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'password', 'first_name', 'last_name']
@@ -28,6 +49,11 @@ class User(AbstractUser):
                 name='unique_email_username'
             )
         ]
+        indexes = [
+            models.Index(fields=['deleted_at'],
+                         name='user_deleted_idx',
+                         condition=models.Q(deleted_at__isnull=False)),
+        ]
         ordering = ['id']
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'